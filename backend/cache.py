@@ -1,23 +1,614 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import inspect
+import json
 import threading
-from typing import Any
+import time
+from typing import Any, Awaitable, Callable, Iterable, Union
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from psycopg.errors import QueryCanceled
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database import query_timeout
+
+# Cached entries are tagged with the data they were built from so writes only
+# drop what they touch. Tags in use:
+#   broadcast:<id>   one broadcast and its recipients
+#   segments         segment rows (names, folder assignment, aggregates)
+#   segment:<id>     one segment's detail page
+#   folders          the folder tree and folder assignments
+#   memberships      contact_segment_memberships
+#   contacts         analytics_contacts
+#   contact:<email>  one contact's detail page
+#   sync             analytics_sync_log
+
+# Normalised parameter values longer than this are hashed in cache keys.
+MAX_KEY_VALUE_LENGTH = 64
+
+# How often a request waiting on a query checks whether its client is still there.
+DISCONNECT_POLL_SECONDS = 0.5
+# nginx's status for a request the client abandoned before the response.
+CLIENT_CLOSED_REQUEST = 499
+
+TagSpec = Union[Iterable[str], Callable[[dict[str, Any]], Iterable[str]]]
+
+
+class CachedResponse:
+    """A JSON response body encoded once, with a strong ETag derived from it."""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    @classmethod
+    def encode(cls, value: Any) -> CachedResponse:
+        body = json.dumps(
+            jsonable_encoder(value),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return cls(body)
+
+    def to_response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+class CachePolicy:
+    """How the responses of one route are cached."""
+
+    __slots__ = ("route", "ttl", "max_bytes", "stale_while_revalidate")
+
+    def __init__(
+        self,
+        route: str = "",
+        ttl: float | None = None,
+        max_bytes: int | None = None,
+        stale_while_revalidate: bool = False,
+    ) -> None:
+        self.route = route
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_while_revalidate = stale_while_revalidate
+
+
+DEFAULT_POLICY = CachePolicy()
+
+
+class _Entry:
+    __slots__ = ("value", "tags", "size", "expires_at", "stale_while_revalidate", "stale_since")
+
+    def __init__(self, value: Any, tags: frozenset[str], policy: CachePolicy) -> None:
+        self.value = value
+        self.tags = tags
+        self.size = len(value.body) if isinstance(value, CachedResponse) else 0
+        self.expires_at = time.monotonic() + policy.ttl if policy.ttl else None
+        self.stale_while_revalidate = policy.stale_while_revalidate
+        self.stale_since: float | None = None
+
+    def stale_at(self, now: float) -> float | None:
+        """When the entry was invalidated or expired, or None while it is fresh."""
+        if self.stale_since is not None:
+            return self.stale_since
+        if self.expires_at is not None and now >= self.expires_at:
+            return self.expires_at
+        return None
+
+    def expired(self, now: float) -> bool:
+        """True once nothing will serve the entry again and it can be dropped."""
+        stale_at = self.stale_at(now)
+        if stale_at is None:
+            return False
+        return not self.stale_while_revalidate or now - stale_at > settings.cache_max_stale_seconds
+
+
+class _Flight:
+    """One in-progress computation that concurrent misses on a key wait on.
+
+    The computation runs in its own task. It is cancelled once every request
+    waiting on it has gone away, unless it is detached (background refresh).
+    """
+
+    def __init__(self, tags: frozenset[str], detached: bool = False) -> None:
+        self.tags = tags
+        self.detached = detached
+        self.invalidated = False
+        self.waiters = 0
+        self.task: asyncio.Task | None = None
+
+
+class _Warmer:
+    __slots__ = ("loader", "tags", "policy")
+
+    def __init__(
+        self, loader: Callable[[], Awaitable[Any]], tags: Iterable[str], policy: CachePolicy
+    ) -> None:
+        self.loader = loader
+        self.tags = frozenset(tags)
+        self.policy = policy
+
+
+class _RouteStats:
+    __slots__ = ("hits", "stale_hits", "misses", "coalesced", "oversize")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.oversize = 0
 
 
 class _Cache:
     def __init__(self) -> None:
-        self._store: dict[str, Any] = {}
+        self._store: dict[str, _Entry] = {}
+        self._tag_keys: dict[str, set[str]] = {}
+        self._flights: dict[str, _Flight] = {}
+        self._warmers: dict[str, _Warmer] = {}
+        self._stats: dict[str, _RouteStats] = {}
+        self._refreshes: set[asyncio.Task] = set()
+        self._publisher: Callable[[tuple[str, ...] | None], None] | None = None
+        self._subscribers: list[Callable[[tuple[str, ...] | None], None]] = []
+        self._swept_at = time.monotonic()
+        # A thread lock rather than an asyncio one: the cache_bus listener
+        # thread invalidates entries too. It is never held across an await.
         self._lock = threading.Lock()
 
     def get(self, key: str) -> Any | None:
-        return self._store.get(key)
+        entry = self._store.get(key)
+        if entry is None or entry.stale_at(time.monotonic()) is not None:
+            return None
+        return entry.value
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = ()) -> None:
+        with self._lock:
+            self._put(key, _Entry(value, frozenset(tags), DEFAULT_POLICY))
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+        policy: CachePolicy = DEFAULT_POLICY,
+    ) -> Any:
+        """Return the cached value for key, computing it at most once at a time.
+
+        Concurrent misses on the same key share a single computation instead of
+        running the query again; it is cancelled only once every caller waiting
+        on it has been cancelled. A result is only stored if none of
+        its tags were invalidated while it was being computed and it fits in
+        the policy's max_bytes.
 
-    def set(self, key: str, value: Any) -> None:
-        self._store[key] = value
+        With stale_while_revalidate, invalidation or TTL expiry only marks the
+        entry stale. For up to CACHE_MAX_STALE_SECONDS the stale value keeps
+        being served while a single background refresh recomputes it; after
+        that, callers block on the refresh like on a plain miss.
+        """
+        entry = self._store.get(key)
+        if entry is not None:
+            now = time.monotonic()
+            stale_at = entry.stale_at(now)
+            if stale_at is None:
+                self._record(policy, "hits")
+                return entry.value
+            if (
+                policy.stale_while_revalidate
+                and now - stale_at <= settings.cache_max_stale_seconds
+            ):
+                self._record(policy, "stale_hits")
+                self._refresh_in_background(key, compute, frozenset(tags), policy)
+                return entry.value
+        return await self._compute(key, compute, frozenset(tags), policy)
 
-    def invalidate_all(self) -> None:
+    def register_warmer(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+        policy: CachePolicy = DEFAULT_POLICY,
+    ) -> None:
+        """Register a hot response that warm() recomputes ahead of requests."""
+        self._warmers[key] = _Warmer(loader, tags, policy)
+
+    async def warm(self, keys: Iterable[str] | None = None) -> list[str]:
+        """Recompute the given registered keys (all of them by default).
+
+        Keys that are already cached and fresh are left alone. Returns the keys
+        that were warmed; failures are logged and skipped.
+        """
+        selected = list(keys) if keys else list(self._warmers)
+        warmed: list[str] = []
+        for key in selected:
+            warmer = self._warmers.get(key)
+            if warmer is None:
+                print(f"WARNING: No cache warmer registered for {key}")
+                continue
+            try:
+                await self._compute(
+                    key,
+                    lambda: _encode(warmer.loader()),
+                    warmer.tags,
+                    warmer.policy,
+                )
+            except Exception as exc:  # noqa: BLE001
+                print(f"WARNING: Cache warming failed for {key}: {exc}")
+                continue
+            warmed.append(key)
+        return warmed
+
+    def stats(self) -> dict[str, Any]:
+        """Entry count, stored bytes and per-route counters since startup."""
         with self._lock:
-            self._store.clear()
+            return {
+                "entries": len(self._store),
+                "bytes": sum(entry.size for entry in self._store.values()),
+                "routes": {
+                    route: {name: getattr(counters, name) for name in _RouteStats.__slots__}
+                    for route, counters in sorted(self._stats.items())
+                },
+            }
+
+    def set_publisher(self, publisher: Callable[[tuple[str, ...] | None], None] | None) -> None:
+        """Forward local invalidations to other workers.
+
+        The publisher receives the invalidated tags, or None for invalidate_all.
+        """
+        self._publisher = publisher
+
+    def subscribe(self, callback: Callable[[tuple[str, ...] | None], None]) -> None:
+        """Call callback after every invalidation, local or from another worker.
+
+        For in-process state derived from the same tables as cached responses.
+        It receives the tags, or None for invalidate_all, possibly on the
+        cache_bus listener thread, so it must be quick and thread-safe.
+        """
+        self._subscribers.append(callback)
+
+    def invalidate_tags(self, *tags: str, publish: bool = True) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for tag in tags:
+                for key in list(self._tag_keys.get(tag, ())):
+                    self._expire(key, now)
+            invalidated = set(tags)
+            for key, flight in list(self._flights.items()):
+                if flight.tags & invalidated:
+                    flight.invalidated = True
+                    del self._flights[key]
+            self._sweep(now)
+        for callback in self._subscribers:
+            callback(tags)
+        if publish and self._publisher is not None:
+            self._publisher(tags)
+
+    def invalidate_all(self, publish: bool = True) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for key in list(self._store):
+                self._expire(key, now)
+            for flight in self._flights.values():
+                flight.invalidated = True
+            self._flights.clear()
+            self._sweep(now)
+        for callback in self._subscribers:
+            callback(None)
+        if publish and self._publisher is not None:
+            self._publisher(None)
+
+    async def _compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        tags: frozenset[str],
+        policy: CachePolicy,
+    ) -> Any:
+        while True:
+            with self._lock:
+                entry = self._store.get(key)
+                if entry is not None and entry.stale_at(time.monotonic()) is None:
+                    self._count(policy, "hits")
+                    return entry.value
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._start_flight(key, compute, tags, policy)
+                flight.waiters += 1
+                self._count(policy, "misses" if leader else "coalesced")
+
+            try:
+                return await asyncio.shield(flight.task)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # The flight was cancelled by its last waiter just before this
+                # request joined it; compute again.
+                continue
+            finally:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.detached and not flight.task.done():
+                    flight.task.cancel()
+
+    def _refresh_in_background(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        tags: frozenset[str],
+        policy: CachePolicy,
+    ) -> None:
+        with self._lock:
+            if key in self._flights:
+                return
+            flight = self._start_flight(key, compute, tags, policy, detached=True)
+
+        def log_failure(task: asyncio.Task) -> None:
+            if not task.cancelled() and task.exception() is not None:
+                print(f"WARNING: Background cache refresh failed for {key}: {task.exception()}")
+
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._refreshes.add(flight.task)
+        flight.task.add_done_callback(self._refreshes.discard)
+        flight.task.add_done_callback(log_failure)
+
+    def _start_flight(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        tags: frozenset[str],
+        policy: CachePolicy,
+        detached: bool = False,
+    ) -> _Flight:
+        # Caller holds self._lock.
+        flight = _Flight(tags, detached)
+        self._flights[key] = flight
+        flight.task = asyncio.get_running_loop().create_task(
+            self._run(key, flight, compute, policy)
+        )
+        return flight
+
+    async def _run(
+        self,
+        key: str,
+        flight: _Flight,
+        compute: Callable[[], Awaitable[Any]],
+        policy: CachePolicy,
+    ) -> Any:
+        try:
+            value = await compute()
+            entry = _Entry(value, flight.tags, policy)
+            with self._lock:
+                if policy.max_bytes is not None and entry.size > policy.max_bytes:
+                    self._count(policy, "oversize")
+                    self._discard(key)
+                elif not flight.invalidated:
+                    self._put(key, entry)
+            return value
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def _record(self, policy: CachePolicy, counter: str) -> None:
+        if policy.route:
+            with self._lock:
+                self._count(policy, counter)
+
+    def _count(self, policy: CachePolicy, counter: str) -> None:
+        # Caller holds self._lock.
+        if not policy.route:
+            return
+        counters = self._stats.get(policy.route)
+        if counters is None:
+            counters = self._stats[policy.route] = _RouteStats()
+        setattr(counters, counter, getattr(counters, counter) + 1)
+
+    def _put(self, key: str, entry: _Entry) -> None:
+        self._discard(key)
+        self._store[key] = entry
+        for tag in entry.tags:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        self._sweep(time.monotonic())
+
+    def _sweep(self, now: float) -> None:
+        # Caller holds self._lock. Stale entries are only replaced when their
+        # key is requested again; without this, keys nobody asks for any more
+        # (e.g. old /segments offsets) would keep their values and tag
+        # references forever. Runs at most once per CACHE_MAX_STALE_SECONDS.
+        if now - self._swept_at < settings.cache_max_stale_seconds:
+            return
+        self._swept_at = now
+        for key, entry in list(self._store.items()):
+            if entry.expired(now):
+                self._discard(key)
+
+    def _expire(self, key: str, now: float) -> None:
+        entry = self._store.get(key)
+        if entry is None:
+            return
+        if not entry.stale_while_revalidate:
+            self._discard(key)
+        elif entry.stale_since is None:
+            entry.stale_since = now
+
+    def _discard(self, key: str) -> None:
+        entry = self._store.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tag_keys.get(tag)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._tag_keys[tag]
 
 
 cache = _Cache()
+
+
+def cache_key(path: str, params: dict[str, Any]) -> str:
+    """Build the canonical cache key for a route from its normalised parameters.
+
+    Path parameters are substituted into the route template and the rest are
+    sorted by name, so equivalent requests always land on the same entry.
+    """
+    query: list[tuple[str, str]] = []
+    for name, value in params.items():
+        placeholder = "{" + name + "}"
+        if placeholder in path:
+            path = path.replace(placeholder, _key_value(value))
+        else:
+            query.append((name, _key_value(value)))
+    if not query:
+        return path
+    return f"{path}?{urlencode(sorted(query), safe=',:[]{}')}"
+
+
+def _key_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple, dict)):
+        value = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    value = str(value)
+    if len(value) > MAX_KEY_VALUE_LENGTH:
+        return "sha256:" + hashlib.sha256(value.encode("utf-8")).hexdigest()
+    return value
+
+
+async def _unless_disconnected(request: Request, work: asyncio.Future) -> Any:
+    """Await work, cancelling it and returning None if the client goes away."""
+    try:
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return work.result()
+            if await request.is_disconnected():
+                return None
+    finally:
+        if not work.done():
+            work.cancel()
+
+
+async def _encode(value: Awaitable[Any]) -> CachedResponse:
+    # Large pages take long enough to serialise that it is done off the event loop.
+    return await run_in_threadpool(CachedResponse.encode, await value)
+
+
+def cached_get(
+    router: APIRouter,
+    path: str,
+    *,
+    params: Callable[..., dict[str, Any]] | None = None,
+    tags: TagSpec = (),
+    ttl: float | None = None,
+    max_bytes: int | None = None,
+    stale_while_revalidate: bool = False,
+    statement_timeout: float | None = None,
+    warm: Iterable[dict[str, Any]] = (),
+) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Register a cached GET route; the decorated async function loads the data.
+
+    params validates and normalises the request parameters: its signature is
+    what FastAPI exposes, and it returns the keyword arguments for the loader.
+    Without it the loader's own signature is exposed as-is. The cache key is
+    built from the normalised arguments with cache_key().
+
+    tags is a tuple or a callable taking the normalised arguments. ttl expires
+    entries without an invalidation, max_bytes (default CACHE_MAX_ENTRY_BYTES)
+    serves larger responses uncached, and warm lists normalised argument sets
+    that warm_hot_keys() recomputes after syncs and imports.
+
+    statement_timeout (default DB_STATEMENT_TIMEOUT_SECONDS) bounds each query
+    of the loader; a timeout is answered with 503. If the client disconnects
+    while waiting, its share of the computation is cancelled and 499 returned.
+    """
+
+    def decorator(loader: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        normalize = params or (lambda **kwargs: kwargs)
+        policy = CachePolicy(
+            route=path,
+            ttl=ttl,
+            max_bytes=settings.cache_max_entry_bytes if max_bytes is None else max_bytes,
+            stale_while_revalidate=stale_while_revalidate,
+        )
+
+        budget = settings.db_statement_timeout_seconds if statement_timeout is None else statement_timeout
+
+        def route_tags(arguments: dict[str, Any]) -> Iterable[str]:
+            return tags(arguments) if callable(tags) else tags
+
+        async def load(arguments: dict[str, Any]) -> Any:
+            with query_timeout(budget):
+                return await loader(**arguments)
+
+        async def endpoint(request: Request, **kwargs: Any) -> Response:
+            arguments = normalize(**kwargs)
+            work = asyncio.ensure_future(
+                cache.get_or_compute(
+                    cache_key(path, arguments),
+                    lambda: _encode(load(arguments)),
+                    tags=route_tags(arguments),
+                    policy=policy,
+                )
+            )
+            try:
+                entry = await _unless_disconnected(request, work)
+            except QueryCanceled as exc:
+                raise HTTPException(
+                    status_code=503, detail="Query took too long; try narrowing the filters"
+                ) from exc
+            if entry is None:
+                return Response(status_code=CLIENT_CLOSED_REQUEST)
+            return entry.to_response(request)
+
+        signature = inspect.signature(params or loader, eval_str=True)
+        request_param = inspect.Parameter(
+            "request", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=Request
+        )
+        endpoint.__signature__ = signature.replace(  # type: ignore[attr-defined]
+            parameters=[request_param, *signature.parameters.values()],
+            return_annotation=Response,
+        )
+        endpoint.__name__ = loader.__name__
+        endpoint.__doc__ = loader.__doc__
+        router.get(path, response_model=None)(endpoint)
+
+        for arguments in warm:
+            cache.register_warmer(
+                cache_key(path, arguments),
+                lambda arguments=arguments: load(arguments),
+                tags=route_tags(arguments),
+                policy=policy,
+            )
+        return loader
+
+    return decorator
+
+
+async def warm_hot_keys() -> None:
+    """Background task run after syncs and imports to refill the hot responses."""
+    await cache.warm(settings.cache_warm_keys)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import threading
+import uuid
+
+import psycopg
+
+from cache import cache
+from config import settings
+from database import get_db, pin_reads_to_primary
+
+# Cache invalidations are broadcast to every worker over this channel so that
+# process-local caches in other uvicorn workers and replicas stay coherent.
+CHANNEL = "analytics_cache_invalidation"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD_BYTES = 7500
+LISTEN_POLL_SECONDS = 5.0
+RECONNECT_DELAY_SECONDS = 2.0
+
+_worker_id = uuid.uuid4().hex
+_listener: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def publish(tags: tuple[str, ...] | None) -> None:
+    """Send an invalidation to the other workers. None means invalidate_all."""
+    try:
+        payloads = _encode(tags)
+        with get_db() as conn:
+            # Plain cursor: a slow NOTIFY must never be re-run by EXPLAIN ANALYZE.
+            with psycopg.Cursor(conn) as cur:
+                for payload in payloads:
+                    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+            conn.commit()
+    except Exception as exc:  # noqa: BLE001
+        print(f"WARNING: Failed to publish cache invalidation: {exc}")
+
+
+def _encode(tags: tuple[str, ...] | None) -> list[str]:
+    if tags is None:
+        return [json.dumps({"origin": _worker_id, "all": True})]
+
+    payloads: list[str] = []
+    chunk: list[str] = []
+    for tag in tags:
+        candidate = json.dumps({"origin": _worker_id, "tags": [*chunk, tag]})
+        if chunk and len(candidate.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+            payloads.append(json.dumps({"origin": _worker_id, "tags": chunk}))
+            chunk = [tag]
+        else:
+            chunk.append(tag)
+    if chunk:
+        payloads.append(json.dumps({"origin": _worker_id, "tags": chunk}))
+    return payloads
+
+
+def _apply(payload: str) -> None:
+    try:
+        message = json.loads(payload)
+    except json.JSONDecodeError:
+        print(f"WARNING: Ignoring malformed cache invalidation: {payload[:200]}")
+        return
+
+    if message.get("origin") == _worker_id:
+        return
+    # Another worker just wrote; don't repopulate from a replica that may lag it.
+    pin_reads_to_primary()
+    if message.get("all"):
+        cache.invalidate_all(publish=False)
+    else:
+        cache.invalidate_tags(*message.get("tags", []), publish=False)
+
+
+def _listen() -> None:
+    connected_before = False
+    while not _stop.is_set():
+        try:
+            with psycopg.connect(settings.database_url, autocommit=True) as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                if connected_before:
+                    # Messages sent while we were disconnected are lost.
+                    cache.invalidate_all(publish=False)
+                connected_before = True
+                while not _stop.is_set():
+                    for notify in conn.notifies(timeout=LISTEN_POLL_SECONDS):
+                        _apply(notify.payload)
+        except Exception as exc:  # noqa: BLE001
+            if _stop.is_set():
+                break
+            print(f"WARNING: Cache invalidation listener disconnected: {exc}")
+            _stop.wait(RECONNECT_DELAY_SECONDS)
+
+
+def start_listener() -> None:
+    global _listener
+    if _listener is not None:
+        return
+    _stop.clear()
+    cache.set_publisher(publish)
+    _listener = threading.Thread(target=_listen, name="cache-bus", daemon=True)
+    _listener.start()
+
+
+def stop_listener() -> None:
+    global _listener
+    if _listener is None:
+        return
+    cache.set_publisher(None)
+    _stop.set()
+    _listener.join(timeout=LISTEN_POLL_SECONDS + 1)
+    _listener = None
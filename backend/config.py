@@ -11,12 +11,34 @@ load_dotenv(Path(__file__).resolve().parents[1] / ".env")
 class Settings:
     def __init__(self) -> None:
         self.database_url = os.getenv("DATABASE_PUBLIC_URL", "").strip()
+        self.database_read_url = os.getenv("DATABASE_READ_URL", "").strip()
+        self.db_primary_pin_seconds = float(os.getenv("DB_PRIMARY_PIN_SECONDS", "5"))
+        self.db_replica_max_lag_seconds = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+        self.db_replica_lag_check_seconds = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "2"))
         self.db_pool_min_size = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
         self.db_pool_max_size = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+        self.db_batch_pool_min_size = int(os.getenv("DB_BATCH_POOL_MIN_SIZE", "0"))
+        self.db_batch_pool_max_size = int(os.getenv("DB_BATCH_POOL_MAX_SIZE", "3"))
+        self.db_batch_pool_timeout_seconds = float(os.getenv("DB_BATCH_POOL_TIMEOUT_SECONDS", "60"))
+        self.db_async_pool_min_size = int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "1"))
+        self.db_async_pool_max_size = int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "10"))
         self.db_pool_timeout_seconds = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))
         self.db_pool_max_lifetime_seconds = float(
             os.getenv("DB_POOL_MAX_LIFETIME_SECONDS", "1800")
         )
+        # Executions of a statement on one connection before psycopg prepares it
+        # server-side; empty disables automatic preparation.
+        prepare_threshold = os.getenv("DB_PREPARE_THRESHOLD", "2").strip()
+        self.db_prepare_threshold = int(prepare_threshold) if prepare_threshold else None
+        self.db_prepared_max = int(os.getenv("DB_PREPARED_MAX", "200"))
+        self.db_statement_timeout_seconds = float(os.getenv("DB_STATEMENT_TIMEOUT_SECONDS", "15"))
+        self.db_slow_query_ms = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+        self.db_slow_query_log_size = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "100"))
+        self.db_slow_query_explain = os.getenv("DB_SLOW_QUERY_EXPLAIN", "").strip().lower() in {
+            "1",
+            "true",
+            "yes",
+        }
         self.resend_api_key = os.getenv("RESEND_API_KEY", "").strip()
         self.resend_base_url = os.getenv("RESEND_BASE_URL", "https://api.resend.com").strip()
         self.kit_api_key = os.getenv("KIT_API_KEY", "").strip()
@@ -24,8 +46,16 @@ class Settings:
         self.request_timeout_seconds = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "20"))
         self.shared_jwt_secret = os.getenv("SHARED_JWT_SECRET", "").strip()
         self.portal_url = os.getenv("PORTAL_URL", "https://portal.entermaya.com").strip()
+        self.metrics_token = os.getenv("METRICS_TOKEN", "").strip()
         self.webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
         self.frontend_dist_dir = Path(__file__).resolve().parents[1] / "frontend" / "dist"
+        self.cache_max_stale_seconds = float(os.getenv("CACHE_MAX_STALE_SECONDS", "30"))
+        self.cache_max_entry_bytes = int(os.getenv("CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+        self.cache_warm_keys = [
+            name.strip()
+            for name in os.getenv("CACHE_WARM_KEYS", "").split(",")
+            if name.strip()
+        ]
 
 
 settings = Settings()
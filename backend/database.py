@@ -1,69 +1,376 @@
 from __future__ import annotations
 
-from contextlib import contextmanager
+import hashlib
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Iterator
+from typing import AsyncIterator, Iterator, Literal
 
 import psycopg
 from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
 from config import settings
+from query_stats import AsyncInstrumentedCursor, AsyncInstrumentedServerCursor, InstrumentedCursor
 
-_db_pool: ConnectionPool | None = None
+Intent = Literal["read", "write"]
+# "interactive" serves HTTP requests; "batch" serves sync, cleanup, Kit import
+# and the Resend membership push so they cannot exhaust the interactive pool.
+PoolName = Literal["interactive", "batch"]
+
+# Arbitrary key for the session advisory lock held while migrating.
+MIGRATIONS_LOCK_ID = 7_311_204_583
+
+# Seconds the replica is behind the primary; 0 when it has replayed everything
+# it received (an idle primary otherwise looks like growing lag).
+REPLICA_LAG_SQL = """
+SELECT CASE
+  WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+  ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+END::float8 AS lag_seconds
+"""
+
+_db_pools: dict[str, ConnectionPool] = {}
+_read_db_pool: ConnectionPool | None = None
+_async_db_pool: AsyncConnectionPool | None = None
+_async_read_db_pool: AsyncConnectionPool | None = None
+
+# Statement timeout for async checkouts in the current task, set by query_timeout().
+_statement_timeout: ContextVar[float | None] = ContextVar("statement_timeout", default=None)
+
+_primary_pinned_until = 0.0
+_replica_lag_seconds = 0.0
+_replica_lag_checked_at = float("-inf")
+
+
+def _configure_connection(conn: psycopg.Connection) -> None:
+    # Prepared statements live per connection, so pooled connections keep the
+    # plans of hot queries across requests. Queries run with prepare=True are
+    # prepared on first use; everything else after DB_PREPARE_THRESHOLD runs.
+    conn.prepare_threshold = settings.db_prepare_threshold
+    conn.prepared_max = settings.db_prepared_max
+
+
+async def _configure_async_connection(conn: psycopg.AsyncConnection) -> None:
+    conn.prepare_threshold = settings.db_prepare_threshold
+    conn.prepared_max = settings.db_prepared_max
+    # Not a connect() argument; named cursors get instrumented this way.
+    conn.server_cursor_factory = AsyncInstrumentedServerCursor
 
 
 def init_db_pool() -> None:
-    global _db_pool
-    if _db_pool is not None:
+    global _read_db_pool
+    if _db_pools:
         return
     if not settings.database_url:
         raise RuntimeError("DATABASE_PUBLIC_URL is not set")
 
-    _db_pool = ConnectionPool(
+    _db_pools["interactive"] = ConnectionPool(
         conninfo=settings.database_url,
+        name="interactive",
         min_size=settings.db_pool_min_size,
         max_size=settings.db_pool_max_size,
         timeout=settings.db_pool_timeout_seconds,
         max_lifetime=settings.db_pool_max_lifetime_seconds,
-        kwargs={"row_factory": dict_row},
+        kwargs={"row_factory": dict_row, "cursor_factory": InstrumentedCursor},
+        configure=_configure_connection,
+        open=True,
+    )
+    _db_pools["batch"] = ConnectionPool(
+        conninfo=settings.database_url,
+        name="batch",
+        min_size=settings.db_batch_pool_min_size,
+        max_size=settings.db_batch_pool_max_size,
+        timeout=settings.db_batch_pool_timeout_seconds,
+        max_lifetime=settings.db_pool_max_lifetime_seconds,
+        kwargs={"row_factory": dict_row, "cursor_factory": InstrumentedCursor},
+        configure=_configure_connection,
         open=True,
     )
+    if settings.database_read_url:
+        _read_db_pool = ConnectionPool(
+            conninfo=settings.database_read_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            timeout=settings.db_pool_timeout_seconds,
+            max_lifetime=settings.db_pool_max_lifetime_seconds,
+            kwargs={"row_factory": dict_row, "cursor_factory": InstrumentedCursor},
+            configure=_configure_connection,
+            open=True,
+        )
 
 
 def close_db_pool() -> None:
-    global _db_pool
-    if _db_pool is not None:
-        _db_pool.close()
-        _db_pool = None
+    global _read_db_pool
+    if _read_db_pool is not None:
+        _read_db_pool.close()
+        _read_db_pool = None
+    for pool in _db_pools.values():
+        pool.close()
+    _db_pools.clear()
+
+
+def pin_reads_to_primary() -> None:
+    """Send reads to the primary for DB_PRIMARY_PIN_SECONDS.
+
+    Called after writes, locally or in another worker, so that a read right
+    after a write does not hit a replica that has not replayed it yet.
+    """
+    global _primary_pinned_until
+    _primary_pinned_until = max(
+        _primary_pinned_until, time.monotonic() + settings.db_primary_pin_seconds
+    )
+
+
+def _replica_usable() -> bool:
+    if time.monotonic() < _primary_pinned_until:
+        return False
+    return _replica_lag_seconds <= settings.db_replica_max_lag_seconds or _lag_check_due()
+
+
+def _lag_check_due() -> bool:
+    return time.monotonic() - _replica_lag_checked_at >= settings.db_replica_lag_check_seconds
+
+
+def _record_replica_lag(lag_seconds: float) -> bool:
+    global _replica_lag_seconds, _replica_lag_checked_at
+    _replica_lag_seconds = lag_seconds
+    _replica_lag_checked_at = time.monotonic()
+    if lag_seconds > settings.db_replica_max_lag_seconds:
+        print(f"WARNING: Read replica is {lag_seconds:.1f}s behind, reading from the primary")
+        return False
+    return True
+
+
+def _replica_fresh(conn: psycopg.Connection) -> bool:
+    if not _lag_check_due():
+        return _replica_lag_seconds <= settings.db_replica_max_lag_seconds
+    with conn.cursor() as cur:
+        cur.execute(REPLICA_LAG_SQL)
+        lag_seconds = cur.fetchone()["lag_seconds"]
+    conn.rollback()
+    return _record_replica_lag(lag_seconds)
+
+
+async def _async_replica_fresh(conn: psycopg.AsyncConnection) -> bool:
+    if not _lag_check_due():
+        return _replica_lag_seconds <= settings.db_replica_max_lag_seconds
+    async with conn.cursor() as cur:
+        await cur.execute(REPLICA_LAG_SQL)
+        lag_seconds = (await cur.fetchone())["lag_seconds"]
+    await conn.rollback()
+    return _record_replica_lag(lag_seconds)
 
 
 @contextmanager
-def get_db() -> Iterator[psycopg.Connection]:
+def get_db(
+    intent: Intent = "write", pool: PoolName = "interactive"
+) -> Iterator[psycopg.Connection]:
+    """Check out a connection from the named pool.
+
+    Interactive checkouts with intent="read" use DATABASE_READ_URL when it is
+    configured, the replica is within DB_REPLICA_MAX_LAG_SECONDS and no write
+    happened recently. Everything else goes to the primary, and write
+    checkouts whose block exits without raising pin reads to the primary
+    for a short while afterwards. Pass intent="read" for lookups on the batch
+    pool too so they don't pin.
+    """
     if not settings.database_url:
         raise RuntimeError("DATABASE_PUBLIC_URL is not set")
 
-    if _db_pool is None:
-        conn = psycopg.connect(settings.database_url, row_factory=dict_row)
+    if (
+        intent == "read"
+        and pool == "interactive"
+        and _read_db_pool is not None
+        and _replica_usable()
+    ):
+        with _read_db_pool.connection() as conn:
+            if _replica_fresh(conn):
+                yield conn
+                return
+
+    db_pool = _db_pools.get(pool)
+    if db_pool is None:
+        conn = psycopg.connect(
+            settings.database_url, row_factory=dict_row, cursor_factory=InstrumentedCursor
+        )
         try:
             yield conn
         finally:
             conn.close()
+    else:
+        with db_pool.connection() as conn:
+            yield conn
+    # Only reached when the block exited normally; one that raised (a 404,
+    # a rolled-back write) has nothing for a replica to lag behind.
+    if intent == "write":
+        pin_reads_to_primary()
+
+
+async def init_async_db_pool() -> None:
+    global _async_db_pool, _async_read_db_pool
+    if _async_db_pool is not None:
         return
+    if not settings.database_url:
+        raise RuntimeError("DATABASE_PUBLIC_URL is not set")
+
+    _async_db_pool = AsyncConnectionPool(
+        conninfo=settings.database_url,
+        min_size=settings.db_async_pool_min_size,
+        max_size=settings.db_async_pool_max_size,
+        timeout=settings.db_pool_timeout_seconds,
+        max_lifetime=settings.db_pool_max_lifetime_seconds,
+        kwargs={"row_factory": dict_row, "cursor_factory": AsyncInstrumentedCursor},
+        configure=_configure_async_connection,
+        open=False,
+    )
+    await _async_db_pool.open()
+    if settings.database_read_url:
+        _async_read_db_pool = AsyncConnectionPool(
+            conninfo=settings.database_read_url,
+            min_size=settings.db_async_pool_min_size,
+            max_size=settings.db_async_pool_max_size,
+            timeout=settings.db_pool_timeout_seconds,
+            max_lifetime=settings.db_pool_max_lifetime_seconds,
+            kwargs={"row_factory": dict_row, "cursor_factory": AsyncInstrumentedCursor},
+            configure=_configure_async_connection,
+            open=False,
+        )
+        await _async_read_db_pool.open()
+
+
+async def close_async_db_pool() -> None:
+    global _async_db_pool, _async_read_db_pool
+    if _async_read_db_pool is not None:
+        await _async_read_db_pool.close()
+        _async_read_db_pool = None
+    if _async_db_pool is not None:
+        await _async_db_pool.close()
+        _async_db_pool = None
+
+
+@contextmanager
+def query_timeout(seconds: float | None) -> Iterator[None]:
+    """Apply a statement_timeout to async checkouts made inside the block."""
+    token = _statement_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _statement_timeout.reset(token)
+
+
+async def _apply_statement_timeout(conn: psycopg.AsyncConnection) -> None:
+    seconds = _statement_timeout.get()
+    if seconds:
+        # Local to the transaction, so it ends when the connection is returned.
+        await conn.execute(
+            "SELECT set_config('statement_timeout', %s, true)", (str(int(seconds * 1000)),)
+        )
 
-    with _db_pool.connection() as conn:
-        yield conn
+
+@asynccontextmanager
+async def get_async_db(intent: Intent = "write") -> AsyncIterator[psycopg.AsyncConnection]:
+    """Async counterpart of get_db, used by the read endpoints.
+
+    Inside query_timeout() every statement on the connection is limited to that
+    many seconds; Postgres cancels it with QueryCanceled beyond that.
+    """
+    if not settings.database_url:
+        raise RuntimeError("DATABASE_PUBLIC_URL is not set")
+
+    if intent == "read" and _async_read_db_pool is not None and _replica_usable():
+        async with _async_read_db_pool.connection() as conn:
+            if await _async_replica_fresh(conn):
+                await _apply_statement_timeout(conn)
+                yield conn
+                return
+
+    if _async_db_pool is None:
+        conn = await psycopg.AsyncConnection.connect(
+            settings.database_url,
+            row_factory=dict_row,
+            cursor_factory=AsyncInstrumentedCursor,
+        )
+        conn.server_cursor_factory = AsyncInstrumentedServerCursor
+        try:
+            await _apply_statement_timeout(conn)
+            yield conn
+        finally:
+            await conn.close()
+    else:
+        async with _async_db_pool.connection() as conn:
+            await _apply_statement_timeout(conn)
+            yield conn
+    if intent == "write":
+        pin_reads_to_primary()
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """psycopg_pool get_stats() for every open pool, keyed by a metrics label."""
+    pools: dict[str, ConnectionPool | AsyncConnectionPool | None] = {
+        **_db_pools,
+        "interactive_replica": _read_db_pool,
+        "async": _async_db_pool,
+        "async_replica": _async_read_db_pool,
+    }
+    return {name: pool.get_stats() for name, pool in pools.items() if pool is not None}
 
 
 def run_migrations() -> None:
+    """Apply the SQL files in migrations/ that have not been applied yet.
+
+    Applied files are recorded with their checksum in schema_migrations and
+    each new file runs in its own transaction. A session advisory lock makes
+    concurrent workers wait for the one that is migrating.
+    """
     migrations_dir = Path(__file__).resolve().parent / "migrations"
     migration_files = sorted(migrations_dir.glob("*.sql"))
     if not migration_files:
         return
 
     with get_db() as conn:
-        with conn.cursor() as cur:
-            for migration_file in migration_files:
-                sql = migration_file.read_text(encoding="utf-8")
-                cur.execute(sql)
-        conn.commit()
+        # A plain cursor for the lock: an instrumented one could EXPLAIN ANALYZE
+        # a slow pg_advisory_lock and take the session lock twice.
+        with conn.cursor() as cur, psycopg.Cursor(conn) as lock:
+            lock.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+            conn.commit()
+            try:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                      filename TEXT PRIMARY KEY,
+                      checksum TEXT NOT NULL,
+                      applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                    """
+                )
+                cur.execute("SELECT filename, checksum FROM schema_migrations")
+                applied = {row["filename"]: row["checksum"] for row in cur.fetchall()}
+                conn.commit()
+
+                for migration_file in migration_files:
+                    sql = migration_file.read_text(encoding="utf-8")
+                    checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+                    applied_checksum = applied.get(migration_file.name)
+                    if applied_checksum is not None:
+                        if applied_checksum != checksum:
+                            print(
+                                f"WARNING: Migration {migration_file.name} changed after it was "
+                                "applied; add a new migration instead of editing it"
+                            )
+                        continue
+
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (filename, checksum) VALUES (%s, %s)",
+                        (migration_file.name, checksum),
+                    )
+                    conn.commit()
+                    print(f"Applied migration {migration_file.name}")
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                lock.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID,))
+                conn.commit()
@@ -2,14 +2,31 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 
 from auth import verify_maya_auth
+from cache import cache
+from cache_bus import start_listener, stop_listener
 from config import settings
-from database import close_db_pool, init_db_pool, run_migrations
-from routers import broadcasts, cleanup, contacts, dashboard, segment_folders, segments, sync, users, webhooks
+from database import (
+    close_async_db_pool,
+    close_db_pool,
+    init_async_db_pool,
+    init_db_pool,
+    pool_stats,
+    run_migrations,
+)
+from metrics import (
+    MetricsMiddleware,
+    exposition,
+    metrics,
+    render_cache_stats,
+    render_pool_stats,
+    render_sync_status,
+)
+from routers import admin, broadcasts, cleanup, contacts, dashboard, segment_folders, segments, sync, users, webhooks
 
 app = FastAPI(title="Maya Email Analytics Service", version="0.1.0")
 
@@ -20,6 +37,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 auth_dep = [Depends(verify_maya_auth)]
 
@@ -31,17 +49,22 @@ app.include_router(segments.router, prefix="/api", tags=["segments"], dependenci
 app.include_router(segment_folders.router, prefix="/api", tags=["segment-folders"], dependencies=auth_dep)
 app.include_router(contacts.router, prefix="/api", tags=["contacts"], dependencies=auth_dep)
 app.include_router(cleanup.router, prefix="/api", tags=["cleanup"], dependencies=auth_dep)
+app.include_router(admin.router, prefix="/api", tags=["admin"], dependencies=auth_dep)
 app.include_router(webhooks.router, prefix="/api", tags=["webhooks"])
 
 
 @app.on_event("startup")
-def on_startup() -> None:
+async def on_startup() -> None:
     init_db_pool()
     run_migrations()
+    await init_async_db_pool()
+    start_listener()
 
 
 @app.on_event("shutdown")
-def on_shutdown() -> None:
+async def on_shutdown() -> None:
+    stop_listener()
+    await close_async_db_pool()
     close_db_pool()
 
 
@@ -50,6 +73,26 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(authorization: str = Header(default="")) -> PlainTextResponse:
+    """Prometheus exposition of this worker's request, pool, cache, API and sync metrics.
+
+    Scrapers have no portal cookie, so the endpoint takes METRICS_TOKEN as a
+    bearer token instead; it is open when METRICS_TOKEN is empty.
+    """
+    if settings.metrics_token and authorization != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+    # In-process state only: a scrape never waits on the database.
+    body = exposition((
+        metrics.render(),
+        render_pool_stats(pool_stats()),
+        render_cache_stats(cache.stats()),
+        render_sync_status(metrics.last_sync),
+    ))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/auth/check")
 def auth_check(user: dict = Depends(verify_maya_auth)) -> dict:
     return {"authenticated": True, "user": user}
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from cache import cache
+from database import get_async_db, query_timeout
+
+# Invalidations carrying one of these tags (or invalidate_all) mean
+# contact_segment_memberships may have changed.
+MEMBERSHIP_TAGS = frozenset({"memberships"})
+# Membership writes also carry segment:<id> for each segment they touched;
+# only those segments are reloaded.
+SEGMENT_TAG_PREFIX = "segment:"
+
+# A reload waits until the first pending write is this old, so a burst of
+# webhook or import writes is picked up by one reload.
+RELOAD_DEBOUNCE_SECONDS = 0.25
+
+# Set bit positions of every byte value, for decoding bitmaps a byte at a time.
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+class _Snapshot:
+    """One bitmap per segment. Never modified once built; reloads build a new one.
+
+    Bitmaps are Python ints with bit i set when the contact with contact_id i
+    is a member: |, & and & ~ run in C over machine words, so a 20-slot
+    expression over a million contacts costs milliseconds without a bitmap
+    library. Identity IDs are dense and never reused, so they index the bits
+    directly. Each bitmap is as wide as its segment's highest contact_id, so
+    memory is O(segments x max contact_id / 8) bytes in every worker.
+    """
+
+    __slots__ = ("bitmaps", "contacts")
+
+    def __init__(self, bitmaps: dict[str, int]) -> None:
+        self.bitmaps = bitmaps
+        everyone = 0
+        for bitmap in bitmaps.values():
+            everyone |= bitmap
+        self.contacts = everyone.bit_count()
+
+    def evaluate(self, slots: list[dict]) -> int:
+        result = 0
+        for index, slot in enumerate(slots):
+            bitmaps = [self.bitmaps.get(segment_id, 0) for segment_id in slot["segment_ids"]]
+            if slot["mode"] == "all":
+                members = bitmaps[0]
+                for bitmap in bitmaps[1:]:
+                    members &= bitmap
+            else:
+                members = 0
+                for bitmap in bitmaps:
+                    members |= bitmap
+
+            if index == 0:
+                result = members
+            elif slot["connector"] == "intersect":
+                result &= members
+            elif slot["connector"] == "exclude":
+                result &= ~members
+            else:
+                result |= members
+        return result
+
+    @staticmethod
+    def members(bitmap: int) -> list[int]:
+        contact_ids: list[int] = []
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        for byte_index, byte in enumerate(data):
+            if byte:
+                base = byte_index * 8
+                contact_ids.extend([base + bit for bit in _BYTE_BITS[byte]])
+        return contact_ids
+
+    def resolve(self, slots: list[dict]) -> list[int]:
+        return self.members(self.evaluate(slots))
+
+
+def _bitmaps(rows: list[Any]) -> dict[str, int]:
+    bitmaps: dict[str, int] = {}
+    for row in rows:
+        bits = bytearray(max(row["contact_ids"]) // 8 + 1)
+        for contact_id in row["contact_ids"]:
+            bits[contact_id >> 3] |= 1 << (contact_id & 7)
+        bitmaps[row["segment_id"]] = int.from_bytes(bits, "little")
+    return bitmaps
+
+
+def _build(rows: list[Any]) -> _Snapshot:
+    return _Snapshot(_bitmaps(rows))
+
+
+def _patch(snapshot: _Snapshot, segment_ids: list[str], rows: list[Any]) -> _Snapshot:
+    """snapshot with the bitmaps of segment_ids replaced by the reloaded rows."""
+    reloaded = set(segment_ids)
+    bitmaps = {
+        segment_id: bitmap
+        for segment_id, bitmap in snapshot.bitmaps.items()
+        if segment_id not in reloaded
+    }
+    bitmaps.update(_bitmaps(rows))
+    return _Snapshot(bitmaps)
+
+
+class _MembershipIndex:
+    """In-process index of contact_segment_memberships for /users slot filters.
+
+    Loaded on first use. Invalidations of the memberships tag, local or from
+    another worker via cache_bus, mark the segment:<id> tags they carry as
+    pending (or everything, when they carry none), and the next use reloads
+    just those segments. Full reloads (sync, /sync/clear, cache_bus reconnects)
+    start in the background right away instead of inside the next /users
+    request, and never run under a request's statement timeout.
+    """
+
+    def __init__(self) -> None:
+        self._snapshot: _Snapshot | None = None
+        self._reload_all = True
+        self._pending: set[str] = set()
+        self._pending_since: float | None = None
+        self._state_lock = threading.Lock()
+        self._load_lock = asyncio.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reload_task: asyncio.Task | None = None
+
+    def invalidate(self, tags: tuple[str, ...] | None = None) -> None:
+        if tags is not None and MEMBERSHIP_TAGS.isdisjoint(tags):
+            return
+        segment_ids = {
+            tag[len(SEGMENT_TAG_PREFIX):]
+            for tag in tags or ()
+            if tag.startswith(SEGMENT_TAG_PREFIX)
+        }
+        with self._state_lock:
+            if segment_ids:
+                self._pending |= segment_ids
+            else:
+                self._reload_all = True
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+        if not segment_ids:
+            self._reload_in_background()
+
+    def _reload_in_background(self) -> None:
+        # Invalidations arrive from request handlers, threadpool jobs and the
+        # cache_bus listener thread alike; hand the reload to the event loop.
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._start_reload)
+        except RuntimeError:
+            pass
+
+    def _start_reload(self) -> None:
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.ensure_future(self._reload())
+
+    async def _reload(self) -> None:
+        try:
+            await self._current()
+        except Exception as exc:  # noqa: BLE001
+            print(f"WARNING: Membership index reload failed: {exc}")
+
+    async def resolve(self, slots: list[dict]) -> list[int]:
+        """contact_ids selected by the slot expression."""
+        snapshot = await self._current()
+        # O(members): a large audience takes long enough to stall the event loop.
+        return await run_in_threadpool(snapshot.resolve, slots)
+
+    def _up_to_date(self) -> bool:
+        return self._snapshot is not None and self._pending_since is None
+
+    async def _current(self) -> _Snapshot:
+        self._loop = asyncio.get_running_loop()
+        if self._up_to_date():
+            return self._snapshot
+        async with self._load_lock:
+            if self._up_to_date():
+                return self._snapshot
+            if self._snapshot is not None and self._pending_since is not None:
+                delay = self._pending_since + RELOAD_DEBOUNCE_SECONDS - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            # Claimed before reading, so a write landing mid-load stays
+            # pending for the following request.
+            with self._state_lock:
+                reload_all = self._reload_all or self._snapshot is None
+                segment_ids = sorted(self._pending)
+                self._reload_all = False
+                self._pending = set()
+                self._pending_since = None
+            try:
+                if reload_all:
+                    # Reads the whole table; the caller's budget is sized for
+                    # one request, and a timeout would only leave it pending.
+                    with query_timeout(None):
+                        rows = await self._fetch(None)
+                else:
+                    rows = await self._fetch(segment_ids)
+            except BaseException:
+                with self._state_lock:
+                    self._reload_all = self._reload_all or reload_all
+                    self._pending.update(segment_ids)
+                    if self._pending_since is None:
+                        self._pending_since = time.monotonic()
+                raise
+
+            if reload_all:
+                self._snapshot = await run_in_threadpool(_build, rows)
+            else:
+                self._snapshot = await run_in_threadpool(_patch, self._snapshot, segment_ids, rows)
+            return self._snapshot
+
+    @staticmethod
+    async def _fetch(segment_ids: list[str] | None) -> list[Any]:
+        where = "" if segment_ids is None else "WHERE segment_id = ANY(%s::uuid[])"
+        async with get_async_db(intent="read") as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    f"""
+                    SELECT segment_id::text AS segment_id, array_agg(contact_id) AS contact_ids
+                    FROM contact_segment_memberships
+                    {where}
+                    GROUP BY segment_id
+                    """,
+                    () if segment_ids is None else (segment_ids,),
+                    prepare=True,
+                )
+                return await cur.fetchall()
+
+    def stats(self) -> dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "current": self._pending_since is None,
+            "pending_segments": None if self._reload_all else len(self._pending),
+            "contacts": snapshot.contacts,
+            "segments": len(snapshot.bitmaps),
+            "bytes": sum((bitmap.bit_length() + 7) // 8 for bitmap in snapshot.bitmaps.values()),
+        }
+
+
+membership_index = _MembershipIndex()
+cache.subscribe(membership_index.invalidate)
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Iterable
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+
+
+class _ApiStats:
+    __slots__ = ("requests", "throttled_seconds")
+
+    def __init__(self) -> None:
+        self.requests: dict[int, int] = {}
+        self.throttled_seconds = 0.0
+
+
+class _Metrics:
+    """Process-wide counters behind /api/metrics.
+
+    Values are per worker; Prometheus tells workers apart by instance and
+    sums them at query time.
+    """
+
+    def __init__(self) -> None:
+        self._latency: dict[tuple[str, str, str], _Histogram] = {}
+        self._apis: dict[str, _ApiStats] = {}
+        self._last_sync: dict[str, Any] | None = None
+        self._lock = threading.Lock()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, str(status))
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def record_api_response(self, api: str, status: int) -> None:
+        with self._lock:
+            stats = self._api(api)
+            stats.requests[status] = stats.requests.get(status, 0) + 1
+
+    def record_api_throttle(self, api: str, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._api(api).throttled_seconds += seconds
+
+    def record_sync(self, row: dict[str, Any]) -> None:
+        """Keep the analytics_sync_log row of a sync this worker just finished."""
+        with self._lock:
+            self._last_sync = dict(row)
+
+    @property
+    def last_sync(self) -> dict[str, Any] | None:
+        with self._lock:
+            return self._last_sync
+
+    def _api(self, api: str) -> _ApiStats:
+        stats = self._apis.get(api)
+        if stats is None:
+            stats = self._apis[api] = _ApiStats()
+        return stats
+
+    def render(self) -> list[str]:
+        with self._lock:
+            latency = [
+                (key, list(hist.counts), hist.count, hist.total)
+                for key, hist in sorted(self._latency.items())
+            ]
+            apis = [
+                (api, dict(stats.requests), stats.throttled_seconds)
+                for api, stats in sorted(self._apis.items())
+            ]
+
+        lines = _header(
+            "analytics_http_request_duration_seconds",
+            "histogram",
+            "Request latency by route template.",
+        )
+        for (method, route, status), counts, count, total in latency:
+            labels = {"method": method, "route": route, "status": status}
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket
+                lines.append(_sample(
+                    "analytics_http_request_duration_seconds_bucket",
+                    {**labels, "le": _format(bound)},
+                    cumulative,
+                ))
+            lines.append(_sample(
+                "analytics_http_request_duration_seconds_bucket", {**labels, "le": "+Inf"}, count
+            ))
+            lines.append(_sample("analytics_http_request_duration_seconds_count", labels, count))
+            lines.append(_sample("analytics_http_request_duration_seconds_sum", labels, total))
+
+        lines += _header(
+            "analytics_api_requests_total", "counter", "Resend and Kit API responses by status."
+        )
+        for api, requests, _ in apis:
+            for status, count in sorted(requests.items()):
+                lines.append(_sample(
+                    "analytics_api_requests_total", {"api": api, "status": str(status)}, count
+                ))
+        lines += _header(
+            "analytics_api_rate_limited_total", "counter", "Resend and Kit API 429 responses."
+        )
+        for api, requests, _ in apis:
+            lines.append(_sample("analytics_api_rate_limited_total", {"api": api}, requests.get(429, 0)))
+        lines += _header(
+            "analytics_api_throttled_seconds_total",
+            "counter",
+            "Time spent waiting on client-side throttling and 429 backoff.",
+        )
+        for api, _, throttled_seconds in apis:
+            lines.append(_sample(
+                "analytics_api_throttled_seconds_total", {"api": api}, throttled_seconds
+            ))
+        return lines
+
+
+def _header(name: str, kind: str, help_text: str) -> list[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def _sample(name: str, labels: dict[str, str], value: float) -> str:
+    if not labels:
+        return f"{name} {_format(value)}"
+    rendered = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+    return f"{name}{{{rendered}}} {_format(value)}"
+
+
+metrics = _Metrics()
+
+
+def render_pool_stats(pools: dict[str, dict[str, int]]) -> list[str]:
+    """Gauges and counters from psycopg_pool get_stats(), one label per pool."""
+    gauges = (
+        ("analytics_db_pool_size", "Connections open in the pool.", lambda s: s.get("pool_size", 0)),
+        ("analytics_db_pool_max", "Configured maximum pool size.", lambda s: s.get("pool_max", 0)),
+        (
+            "analytics_db_pool_in_use",
+            "Connections checked out of the pool.",
+            lambda s: s.get("pool_size", 0) - s.get("pool_available", 0),
+        ),
+        (
+            "analytics_db_pool_waiting",
+            "Requests waiting for a connection.",
+            lambda s: s.get("requests_waiting", 0),
+        ),
+    )
+    counters = (
+        (
+            "analytics_db_pool_requests_total",
+            "Connections requested from the pool.",
+            lambda s: s.get("requests_num", 0),
+        ),
+        (
+            "analytics_db_pool_queued_total",
+            "Requests that had to wait for a connection.",
+            lambda s: s.get("requests_queued", 0),
+        ),
+        (
+            "analytics_db_pool_wait_seconds_total",
+            "Time spent waiting for a connection.",
+            lambda s: s.get("requests_wait_ms", 0) / 1000,
+        ),
+        (
+            "analytics_db_pool_timeouts_total",
+            "Requests that timed out waiting for a connection.",
+            lambda s: s.get("requests_errors", 0),
+        ),
+    )
+    lines: list[str] = []
+    for kind, families in (("gauge", gauges), ("counter", counters)):
+        for name, help_text, value in families:
+            lines += _header(name, kind, help_text)
+            for pool, stats in pools.items():
+                lines.append(_sample(name, {"pool": pool}, value(stats)))
+    return lines
+
+
+def render_cache_stats(stats: dict[str, Any]) -> list[str]:
+    """Entry count, size and hit counters from cache.stats()."""
+    lines = _header("analytics_cache_entries", "gauge", "Responses held in the cache.")
+    lines.append(_sample("analytics_cache_entries", {}, stats["entries"]))
+    lines += _header("analytics_cache_bytes", "gauge", "Encoded size of the cached responses.")
+    lines.append(_sample("analytics_cache_bytes", {}, stats["bytes"]))
+
+    lines += _header(
+        "analytics_cache_lookups_total", "counter", "Cache lookups by route and outcome."
+    )
+    served = looked_up = 0
+    for route, counters in stats["routes"].items():
+        for outcome, count in counters.items():
+            lines.append(_sample(
+                "analytics_cache_lookups_total", {"route": route, "outcome": outcome}, count
+            ))
+        served += counters["hits"] + counters["stale_hits"]
+        looked_up += counters["hits"] + counters["stale_hits"] + counters["misses"] + counters["coalesced"]
+
+    lines += _header(
+        "analytics_cache_hit_ratio", "gauge", "Share of lookups served from the cache."
+    )
+    lines.append(_sample("analytics_cache_hit_ratio", {}, served / looked_up if looked_up else 0.0))
+    return lines
+
+
+def render_sync_status(row: dict[str, Any] | None) -> list[str]:
+    """Duration and data lag of the last sync completed, as recorded by record_sync."""
+    if not row:
+        return []
+    lines = _header(
+        "analytics_sync_last_duration_seconds", "gauge", "Duration of the last completed sync."
+    )
+    lines.append(_sample(
+        "analytics_sync_last_duration_seconds",
+        {"status": row["status"]},
+        (row["completed_at"] - row["started_at"]).total_seconds(),
+    ))
+    lines += _header(
+        "analytics_sync_last_completed_timestamp_seconds",
+        "gauge",
+        "Unix time the last sync completed.",
+    )
+    lines.append(_sample(
+        "analytics_sync_last_completed_timestamp_seconds", {}, row["completed_at"].timestamp()
+    ))
+    if row["last_processed_webhook_received_at"] is not None:
+        lines += _header(
+            "analytics_sync_lag_seconds",
+            "gauge",
+            "Age of the newest webhook event the last sync processed.",
+        )
+        lines.append(_sample(
+            "analytics_sync_lag_seconds",
+            {},
+            time.time() - row["last_processed_webhook_received_at"].timestamp(),
+        ))
+    return lines
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request by its route template.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed responses are timed
+    to their last chunk and are not buffered.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - started,
+            )
+
+
+def exposition(sections: Iterable[list[str]]) -> str:
+    lines = [line for section in sections for line in section]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,69 @@
+-- One row per lowercased email: the best of its resend/kit analytics_contacts
+-- rows. Maintained by services/canonical_contacts.py so readers no longer
+-- rank every contact with ROW_NUMBER() on each request.
+CREATE TABLE IF NOT EXISTS analytics_contacts_canonical (
+    email TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    unsubscribed BOOLEAN NOT NULL DEFAULT FALSE,
+    total_sent INTEGER NOT NULL DEFAULT 0,
+    total_delivered INTEGER NOT NULL DEFAULT 0,
+    total_opened INTEGER NOT NULL DEFAULT 0,
+    total_clicked INTEGER NOT NULL DEFAULT 0,
+    total_bounced INTEGER NOT NULL DEFAULT 0,
+    total_suppressed INTEGER NOT NULL DEFAULT 0,
+    total_complained INTEGER NOT NULL DEFAULT 0,
+    open_rate NUMERIC(7, 4) NOT NULL DEFAULT 0,
+    click_rate NUMERIC(7, 4) NOT NULL DEFAULT 0,
+    source TEXT NOT NULL,
+    synced_at TIMESTAMPTZ
+);
+
+-- /users sorts by one of these, then by email in the same direction, so each
+-- index serves both ascending and descending pages.
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_total_delivered
+    ON analytics_contacts_canonical (total_delivered, email);
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_open_rate
+    ON analytics_contacts_canonical (open_rate, email);
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_click_rate
+    ON analytics_contacts_canonical (click_rate, email);
+
+-- Incremental refreshes look source rows up by lowercased email.
+CREATE INDEX IF NOT EXISTS idx_analytics_contacts_lower_email
+    ON analytics_contacts (LOWER(email));
+
+-- Backfill.
+INSERT INTO analytics_contacts_canonical (
+    email, id, first_name, last_name, unsubscribed,
+    total_sent, total_delivered, total_opened, total_clicked,
+    total_bounced, total_suppressed, total_complained,
+    open_rate, click_rate, source, synced_at
+)
+SELECT DISTINCT ON (LOWER(email))
+  LOWER(email),
+  id,
+  first_name,
+  last_name,
+  unsubscribed,
+  total_sent,
+  total_delivered,
+  total_opened,
+  total_clicked,
+  total_bounced,
+  total_suppressed,
+  total_complained,
+  open_rate,
+  click_rate,
+  source,
+  synced_at
+FROM analytics_contacts
+ORDER BY
+  LOWER(email),
+  total_delivered DESC,
+  total_sent DESC,
+  total_opened DESC,
+  total_clicked DESC,
+  synced_at DESC NULLS LAST,
+  id ASC
+ON CONFLICT (email) DO NOTHING;
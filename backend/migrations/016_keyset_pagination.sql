@@ -0,0 +1,13 @@
+-- Indexes matching the keyset ORDER BY of /broadcasts and
+-- /broadcasts/{id}/recipients (see BROADCAST_SORT_KEY and RECIPIENT_SORT_KEY
+-- in routers/broadcasts.py), so a cursor seeks straight to the next page.
+CREATE INDEX IF NOT EXISTS idx_analytics_broadcasts_sent_keyset
+    ON analytics_broadcasts (COALESCE(sent_at, created_at, '-infinity'::timestamptz) DESC, id DESC)
+    WHERE status IN ('sent', 'completed');
+
+CREATE INDEX IF NOT EXISTS idx_analytics_recipients_event_keyset
+    ON analytics_broadcast_recipients (
+        broadcast_id,
+        COALESCE(last_event_at, sent_at, '-infinity'::timestamptz) DESC,
+        id DESC
+    );
@@ -0,0 +1,24 @@
+-- Substring search (q=) on users, broadcasts and recipients. search.like_pattern
+-- sends queries of 3+ characters as '%q%' (trigram GIN indexes) and shorter
+-- ones as 'q%' (text_pattern_ops b-tree indexes).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- analytics_contacts_canonical.email is already lowercased.
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_email_trgm
+    ON analytics_contacts_canonical USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_email_prefix
+    ON analytics_contacts_canonical (email text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_analytics_broadcasts_name_trgm
+    ON analytics_broadcasts USING gin (LOWER(name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_analytics_broadcasts_subject_trgm
+    ON analytics_broadcasts USING gin (LOWER(subject) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_analytics_broadcasts_name_prefix
+    ON analytics_broadcasts (LOWER(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_analytics_broadcasts_subject_prefix
+    ON analytics_broadcasts (LOWER(subject) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_analytics_recipients_email_trgm
+    ON analytics_broadcast_recipients USING gin (LOWER(email_address) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_analytics_recipients_email_prefix
+    ON analytics_broadcast_recipients (broadcast_id, LOWER(email_address) text_pattern_ops);
@@ -0,0 +1,106 @@
+-- Closure table of the folder tree and a denormalised root folder per segment,
+-- replacing the recursive folder_roots CTEs. Both are maintained by triggers,
+-- so folder edits and segment moves keep them in step in the same transaction.
+CREATE TABLE IF NOT EXISTS analytics_segment_folder_closure (
+    ancestor_id INTEGER NOT NULL REFERENCES analytics_segment_folders(id) ON DELETE CASCADE,
+    descendant_id INTEGER NOT NULL REFERENCES analytics_segment_folders(id) ON DELETE CASCADE,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_segment_folder_closure_descendant
+    ON analytics_segment_folder_closure (descendant_id, depth);
+
+INSERT INTO analytics_segment_folder_closure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE paths AS (
+    SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+    FROM analytics_segment_folders
+
+    UNION ALL
+
+    SELECT paths.ancestor_id, child.id, paths.depth + 1
+    FROM analytics_segment_folders child
+    JOIN paths ON child.parent_id = paths.descendant_id
+)
+SELECT ancestor_id, descendant_id, depth FROM paths
+ON CONFLICT (ancestor_id, descendant_id) DO NOTHING;
+
+ALTER TABLE analytics_segments ADD COLUMN IF NOT EXISTS root_folder_id INTEGER
+    REFERENCES analytics_segment_folders(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_analytics_segments_root_folder_id
+    ON analytics_segments (root_folder_id);
+
+CREATE OR REPLACE FUNCTION analytics_folder_root(folder INTEGER) RETURNS INTEGER
+LANGUAGE sql STABLE AS $$
+    SELECT ancestor_id
+    FROM analytics_segment_folder_closure
+    WHERE descendant_id = folder
+    ORDER BY depth DESC
+    LIMIT 1
+$$;
+
+UPDATE analytics_segments
+SET root_folder_id = analytics_folder_root(folder_id)
+WHERE folder_id IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION analytics_segment_folders_closure_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO analytics_segment_folder_closure (ancestor_id, descendant_id, depth)
+        SELECT NEW.id, NEW.id, 0
+        UNION ALL
+        SELECT ancestor_id, NEW.id, depth + 1
+        FROM analytics_segment_folder_closure
+        WHERE descendant_id = NEW.parent_id;
+        RETURN NULL;
+    END IF;
+
+    IF NEW.parent_id IS NOT DISTINCT FROM OLD.parent_id THEN
+        RETURN NULL;
+    END IF;
+
+    -- Detach the moved subtree from its old ancestors, then attach it under
+    -- the new parent's ancestors.
+    DELETE FROM analytics_segment_folder_closure
+    WHERE descendant_id IN (
+            SELECT descendant_id FROM analytics_segment_folder_closure WHERE ancestor_id = NEW.id
+        )
+      AND ancestor_id NOT IN (
+            SELECT descendant_id FROM analytics_segment_folder_closure WHERE ancestor_id = NEW.id
+        );
+
+    INSERT INTO analytics_segment_folder_closure (ancestor_id, descendant_id, depth)
+    SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+    FROM analytics_segment_folder_closure above
+    CROSS JOIN analytics_segment_folder_closure below
+    WHERE above.descendant_id = NEW.parent_id
+      AND below.ancestor_id = NEW.id;
+
+    UPDATE analytics_segments
+    SET root_folder_id = analytics_folder_root(folder_id)
+    WHERE folder_id IN (
+        SELECT descendant_id FROM analytics_segment_folder_closure WHERE ancestor_id = NEW.id
+    );
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_segment_folders_closure ON analytics_segment_folders;
+CREATE TRIGGER trg_segment_folders_closure
+    AFTER INSERT OR UPDATE OF parent_id ON analytics_segment_folders
+    FOR EACH ROW EXECUTE FUNCTION analytics_segment_folders_closure_sync();
+
+CREATE OR REPLACE FUNCTION analytics_segments_root_folder_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.root_folder_id := analytics_folder_root(NEW.folder_id);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_segments_root_folder ON analytics_segments;
+CREATE TRIGGER trg_segments_root_folder
+    BEFORE INSERT OR UPDATE OF folder_id ON analytics_segments
+    FOR EACH ROW EXECUTE FUNCTION analytics_segments_root_folder_sync();
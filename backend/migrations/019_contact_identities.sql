@@ -0,0 +1,131 @@
+-- One BIGINT per lowercased email, carried as contact_id by memberships,
+-- recipients and canonical contacts so joins and distinct counts compare
+-- integers instead of text. IDs are never reused or deleted, which also
+-- makes them usable as bit positions (see membership_index.py).
+CREATE TABLE IF NOT EXISTS analytics_contact_identities (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE CHECK (email = LOWER(email))
+);
+
+INSERT INTO analytics_contact_identities (email)
+SELECT email
+FROM (
+    SELECT LOWER(email) AS email FROM analytics_contacts
+    UNION
+    SELECT LOWER(contact_email) FROM contact_segment_memberships
+    UNION
+    SELECT LOWER(email_address) FROM analytics_broadcast_recipients
+) emails
+ORDER BY email
+ON CONFLICT (email) DO NOTHING;
+
+-- Looks up before inserting so existing emails don't burn identity values;
+-- ON CONFLICT only covers two sessions adding the same new email at once.
+CREATE OR REPLACE FUNCTION analytics_contact_id(address TEXT) RETURNS BIGINT
+LANGUAGE plpgsql AS $$
+DECLARE
+    normalised TEXT := LOWER(address);
+    found BIGINT;
+BEGIN
+    IF normalised IS NULL THEN
+        RETURN NULL;
+    END IF;
+    SELECT id INTO found FROM analytics_contact_identities WHERE email = normalised;
+    IF found IS NULL THEN
+        INSERT INTO analytics_contact_identities (email) VALUES (normalised)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id INTO found;
+    END IF;
+    IF found IS NULL THEN
+        SELECT id INTO found FROM analytics_contact_identities WHERE email = normalised;
+    END IF;
+    RETURN found;
+END
+$$;
+
+-- Memberships.
+ALTER TABLE contact_segment_memberships ADD COLUMN IF NOT EXISTS contact_id BIGINT
+    REFERENCES analytics_contact_identities(id);
+
+UPDATE contact_segment_memberships m
+SET contact_id = i.id
+FROM analytics_contact_identities i
+WHERE i.email = LOWER(m.contact_email)
+  AND m.contact_id IS NULL;
+
+ALTER TABLE contact_segment_memberships ALTER COLUMN contact_id SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_csm_contact_id
+    ON contact_segment_memberships (contact_id);
+-- Per-segment distinct counts and the membership index read only these two.
+CREATE INDEX IF NOT EXISTS idx_csm_segment_contact_id
+    ON contact_segment_memberships (segment_id, contact_id);
+
+CREATE OR REPLACE FUNCTION contact_segment_memberships_contact_id_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.contact_id := analytics_contact_id(NEW.contact_email);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_csm_contact_id ON contact_segment_memberships;
+CREATE TRIGGER trg_csm_contact_id
+    BEFORE INSERT OR UPDATE OF contact_email ON contact_segment_memberships
+    FOR EACH ROW EXECUTE FUNCTION contact_segment_memberships_contact_id_sync();
+
+-- Broadcast recipients.
+ALTER TABLE analytics_broadcast_recipients ADD COLUMN IF NOT EXISTS contact_id BIGINT
+    REFERENCES analytics_contact_identities(id);
+
+UPDATE analytics_broadcast_recipients r
+SET contact_id = i.id
+FROM analytics_contact_identities i
+WHERE i.email = LOWER(r.email_address)
+  AND r.contact_id IS NULL;
+
+ALTER TABLE analytics_broadcast_recipients ALTER COLUMN contact_id SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_analytics_recipients_contact_id
+    ON analytics_broadcast_recipients (contact_id);
+
+CREATE OR REPLACE FUNCTION analytics_broadcast_recipients_contact_id_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.contact_id := analytics_contact_id(NEW.email_address);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_recipients_contact_id ON analytics_broadcast_recipients;
+CREATE TRIGGER trg_recipients_contact_id
+    BEFORE INSERT OR UPDATE OF email_address ON analytics_broadcast_recipients
+    FOR EACH ROW EXECUTE FUNCTION analytics_broadcast_recipients_contact_id_sync();
+
+-- Canonical contacts.
+ALTER TABLE analytics_contacts_canonical ADD COLUMN IF NOT EXISTS contact_id BIGINT
+    REFERENCES analytics_contact_identities(id);
+
+UPDATE analytics_contacts_canonical cc
+SET contact_id = i.id
+FROM analytics_contact_identities i
+WHERE i.email = cc.email
+  AND cc.contact_id IS NULL;
+
+ALTER TABLE analytics_contacts_canonical ALTER COLUMN contact_id SET NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_canonical_contact_id
+    ON analytics_contacts_canonical (contact_id);
+
+CREATE OR REPLACE FUNCTION analytics_contacts_canonical_contact_id_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.contact_id := analytics_contact_id(NEW.email);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_contacts_canonical_contact_id ON analytics_contacts_canonical;
+CREATE TRIGGER trg_contacts_canonical_contact_id
+    BEFORE INSERT OR UPDATE OF email ON analytics_contacts_canonical
+    FOR EACH ROW EXECUTE FUNCTION analytics_contacts_canonical_contact_id_sync();
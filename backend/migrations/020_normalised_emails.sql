@@ -0,0 +1,44 @@
+-- Email lookups go through normalised values only: lowercased stored columns
+-- (canonical contacts, identities, memberships) or LOWER(...) expression
+-- indexes (analytics_contacts from 015, recipient search from 017). Raw-column
+-- indexes that no query can use are dropped.
+
+-- Membership emails are compared with lowercased keys everywhere; make that
+-- a guarantee. Case variants of the same email in one segment collapse to
+-- one row first so the rewrite cannot hit the primary key.
+DELETE FROM contact_segment_memberships m
+USING contact_segment_memberships keep
+WHERE m.contact_email <> LOWER(m.contact_email)
+  AND keep.segment_id = m.segment_id
+  AND LOWER(keep.contact_email) = LOWER(m.contact_email)
+  AND (keep.contact_email = LOWER(keep.contact_email) OR keep.ctid < m.ctid);
+
+UPDATE contact_segment_memberships
+SET contact_email = LOWER(contact_email)
+WHERE contact_email <> LOWER(contact_email);
+
+ALTER TABLE contact_segment_memberships
+    DROP CONSTRAINT IF EXISTS contact_segment_memberships_email_lowercase;
+ALTER TABLE contact_segment_memberships
+    ADD CONSTRAINT contact_segment_memberships_email_lowercase
+    CHECK (contact_email = LOWER(contact_email));
+
+ALTER TABLE analytics_contacts_canonical
+    DROP CONSTRAINT IF EXISTS analytics_contacts_canonical_email_lowercase;
+ALTER TABLE analytics_contacts_canonical
+    ADD CONSTRAINT analytics_contacts_canonical_email_lowercase
+    CHECK (email = LOWER(email));
+
+-- Segment member listings page through one segment in email order.
+CREATE INDEX IF NOT EXISTS idx_csm_segment_contact_email
+    ON contact_segment_memberships (segment_id, contact_email);
+
+-- Leading columns of the primary key and of the (segment_id, ...) indexes.
+DROP INDEX IF EXISTS idx_csm_contact_email;
+DROP INDEX IF EXISTS idx_csm_segment_id;
+
+-- Covered by the (email, source) unique constraint; lookups use LOWER(email).
+DROP INDEX IF EXISTS idx_analytics_contacts_email;
+
+-- Recipients are matched by contact_id (019) or LOWER(email_address) (017).
+DROP INDEX IF EXISTS idx_analytics_recipients_email_address;
@@ -0,0 +1,9 @@
+-- /users breaks sort ties on email ASC in both directions. The (sort, email)
+-- indexes from 015 serve ascending pages; descending pages need the sort
+-- column reversed with email still ascending.
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_total_delivered_desc
+    ON analytics_contacts_canonical (total_delivered DESC, email);
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_open_rate_desc
+    ON analytics_contacts_canonical (open_rate DESC, email);
+CREATE INDEX IF NOT EXISTS idx_contacts_canonical_click_rate_desc
+    ON analytics_contacts_canonical (click_rate DESC, email);
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from typing import Any, Callable, Sequence
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+
+def encode_cursor(scope: str, values: Sequence[Any]) -> str:
+    """Opaque token for keyset pagination holding the last row's sort key.
+
+    scope names the listing and ordering the values belong to, so a cursor
+    from one sort order is rejected by another instead of seeking nonsense.
+    """
+    payload = json.dumps({"s": scope, "v": jsonable_encoder(list(values))}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str | None, scope: str, size: int) -> list[Any] | None:
+    """Sort key values from a cursor made by encode_cursor, or None without one.
+
+    Values come back JSON-typed (timestamps and UUIDs as strings); queries
+    cast the placeholders to the column types.
+    """
+    if not token or not token.strip():
+        return None
+    token = token.strip()
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    values = payload.get("v")
+    if payload.get("s") != scope or not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor does not match this listing")
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def next_cursor(
+    rows: Sequence[dict], limit: int, scope: str, key: Callable[[dict], Sequence[Any]]
+) -> str | None:
+    """Cursor for the page after rows, or None when rows was the last page."""
+    if len(rows) < limit:
+        return None
+    return encode_cursor(scope, key(rows[-1]))
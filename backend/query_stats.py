@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any
+
+import psycopg
+from psycopg import sql
+
+from config import settings
+
+# Durations kept per fingerprint for the percentiles.
+SAMPLE_SIZE = 500
+
+_COMMENT_RE = re.compile(r"--[^\n]*")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%(?:\(\w+\))?s")
+_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE_RE = re.compile(r"^\s*(?:SELECT|WITH)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE)\b", re.IGNORECASE)
+_FROM_RE = re.compile(r"\bFROM\b", re.IGNORECASE)
+# Functions whose effects would happen a second time under EXPLAIN ANALYZE.
+_SIDE_EFFECT_RE = re.compile(
+    r"\b(?:pg_advisory_\w+|pg_try_advisory_\w+|pg_notify|set_config|nextval|setval)\s*\(",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query: str) -> str:
+    """Normalise a statement so executions with different values group together."""
+    text = _COMMENT_RE.sub(" ", query)
+    text = _STRING_RE.sub("?", text)
+    text = _PLACEHOLDER_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _LIST_RE.sub("?, ...", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class _QueryStats:
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.samples: deque[float] = deque(maxlen=SAMPLE_SIZE)
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self._stats: dict[str, _QueryStats] = {}
+        self._slow: deque[dict[str, Any]] = deque(maxlen=settings.db_slow_query_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, query: str, duration_ms: float, rows: int) -> None:
+        key = fingerprint(query)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _QueryStats()
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.rows += max(rows, 0)
+            stats.samples.append(duration_ms)
+
+    def record_slow(self, query: str, duration_ms: float, rows: int, plan: str | None) -> None:
+        with self._lock:
+            self._slow.append({
+                "fingerprint": fingerprint(query),
+                "duration_ms": round(duration_ms, 2),
+                "rows": max(rows, 0),
+                "at": time.time(),
+                "plan": plan,
+            })
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            queries = [
+                {
+                    "fingerprint": key,
+                    "count": stats.count,
+                    "total_ms": round(stats.total_ms, 2),
+                    "p50_ms": round(_percentile(stats.samples, 0.50), 2),
+                    "p95_ms": round(_percentile(stats.samples, 0.95), 2),
+                    "max_ms": round(stats.max_ms, 2),
+                    "rows": stats.rows,
+                }
+                for key, stats in self._stats.items()
+            ]
+            slow = list(reversed(self._slow))
+        queries.sort(key=lambda row: row["total_ms"], reverse=True)
+        return {
+            "slow_query_ms": settings.db_slow_query_ms,
+            "queries": queries,
+            "slow": slow,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+def _percentile(samples: deque[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+registry = _Registry()
+
+
+def _query_text(query: Any, conn: Any) -> str:
+    if isinstance(query, sql.Composable):
+        return query.as_string(conn)
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    return str(query)
+
+
+def _explainable(text: str) -> bool:
+    # EXPLAIN ANALYZE runs the statement again, so only ever do it for reads
+    # of a table that call nothing with side effects (locks, NOTIFY, GUCs,
+    # sequences).
+    return (
+        bool(_EXPLAINABLE_RE.match(text))
+        and bool(_FROM_RE.search(text))
+        and not _WRITE_RE.search(text)
+        and not _SIDE_EFFECT_RE.search(text)
+    )
+
+
+def _format_plan(rows: list[Any]) -> str:
+    return "\n".join(
+        row["QUERY PLAN"] if isinstance(row, dict) else row[0] for row in rows
+    )
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor that times every statement into the query stats registry."""
+
+    def execute(self, query: Any, params: Any = None, **kwargs: Any) -> InstrumentedCursor:
+        started = time.perf_counter()
+        try:
+            super().execute(query, params, **kwargs)
+        except BaseException:
+            self._record(query, None, started, explain=False)
+            raise
+        self._record(query, params, started, explain=True)
+        return self
+
+    def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        started = time.perf_counter()
+        try:
+            super().executemany(query, params_seq, **kwargs)
+        finally:
+            self._record(query, None, started, explain=False)
+
+    def _record(self, query: Any, params: Any, started: float, explain: bool) -> None:
+        duration_ms = (time.perf_counter() - started) * 1000
+        text = _query_text(query, self.connection)
+        registry.record(text, duration_ms, self.rowcount)
+        if duration_ms < settings.db_slow_query_ms:
+            return
+        plan = None
+        if explain and settings.db_slow_query_explain and _explainable(text):
+            plan = self._explain(text, params)
+        registry.record_slow(text, duration_ms, self.rowcount, plan)
+
+    def _explain(self, text: str, params: Any) -> str | None:
+        try:
+            # A savepoint keeps a failed EXPLAIN from aborting the caller's transaction.
+            with self.connection.transaction(), psycopg.Cursor(self.connection) as cur:
+                cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {text}", params)
+                return _format_plan(cur.fetchall())
+        except psycopg.Error as exc:
+            return f"EXPLAIN failed: {exc}"
+
+
+class AsyncInstrumentedCursor(psycopg.AsyncCursor):
+    """Async counterpart of InstrumentedCursor."""
+
+    async def execute(
+        self, query: Any, params: Any = None, **kwargs: Any
+    ) -> AsyncInstrumentedCursor:
+        started = time.perf_counter()
+        try:
+            await super().execute(query, params, **kwargs)
+        except BaseException:
+            await self._record(query, None, started, explain=False)
+            raise
+        await self._record(query, params, started, explain=True)
+        return self
+
+    async def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        started = time.perf_counter()
+        try:
+            await super().executemany(query, params_seq, **kwargs)
+        finally:
+            await self._record(query, None, started, explain=False)
+
+    async def _record(self, query: Any, params: Any, started: float, explain: bool) -> None:
+        duration_ms = (time.perf_counter() - started) * 1000
+        text = _query_text(query, self.connection)
+        registry.record(text, duration_ms, self.rowcount)
+        if duration_ms < settings.db_slow_query_ms:
+            return
+        plan = None
+        if explain and settings.db_slow_query_explain and _explainable(text):
+            plan = await self._explain(text, params)
+        registry.record_slow(text, duration_ms, self.rowcount, plan)
+
+    async def _explain(self, text: str, params: Any) -> str | None:
+        try:
+            async with self.connection.transaction(), psycopg.AsyncCursor(self.connection) as cur:
+                await cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {text}", params)
+                return _format_plan(await cur.fetchall())
+        except psycopg.Error as exc:
+            return f"EXPLAIN failed: {exc}"
+
+
+class AsyncInstrumentedServerCursor(psycopg.AsyncServerCursor):
+    """Named (server-side) cursor recorded like AsyncInstrumentedCursor.
+
+    DECLARE returns at once and the work happens in the FETCHes, so one sample
+    covers execute through close, with the rows fetched. It is never
+    EXPLAINed: the statement is a stream its caller reads at its own pace.
+    """
+
+    _text: str | None = None
+    _started = 0.0
+    _fetched = 0
+
+    async def execute(
+        self, query: Any, params: Any = None, **kwargs: Any
+    ) -> AsyncInstrumentedServerCursor:
+        self._text = _query_text(query, self.connection)
+        self._started = time.perf_counter()
+        self._fetched = 0
+        await super().execute(query, params, **kwargs)
+        return self
+
+    async def fetchmany(self, size: int = 0) -> list[Any]:
+        rows = await super().fetchmany(size)
+        self._fetched += len(rows)
+        return rows
+
+    async def close(self) -> None:
+        try:
+            await super().close()
+        finally:
+            if self._text is not None:
+                duration_ms = (time.perf_counter() - self._started) * 1000
+                registry.record(self._text, duration_ms, self._fetched)
+                if duration_ms >= settings.db_slow_query_ms:
+                    registry.record_slow(self._text, duration_ms, self._fetched, None)
+                self._text = None
@@ -1,6 +1,7 @@
-from . import broadcasts, cleanup, contacts, dashboard, segment_folders, segments, sync, users, webhooks
+from . import admin, broadcasts, cleanup, contacts, dashboard, segment_folders, segments, sync, users, webhooks
 
 __all__ = [
+    "admin",
     "broadcasts",
     "cleanup",
     "contacts",
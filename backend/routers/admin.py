@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from fastapi import APIRouter
+
+from cache import cache
+from membership_index import membership_index
+from query_stats import registry
+
+router = APIRouter()
+
+
+@router.get("/admin/cache-stats")
+def get_cache_stats() -> dict:
+    return {**cache.stats(), "membership_index": membership_index.stats()}
+
+
+@router.get("/admin/query-stats")
+def get_query_stats() -> dict:
+    """Per-fingerprint statement timings and the slow-query log since startup or reset."""
+    return registry.snapshot()
+
+
+@router.post("/admin/query-stats/reset")
+def reset_query_stats() -> dict:
+    registry.reset()
+    return {"ok": True}
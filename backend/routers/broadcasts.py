@@ -1,104 +1,116 @@
 from __future__ import annotations
 
+from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter, HTTPException, Query
 
-from cache import cache
-from database import get_db
+from cache import cached_get
+from database import get_async_db
+from pagination import decode_cursor, next_cursor
+from search import like_pattern
 
 router = APIRouter()
 
+BROADCAST_LIST_TAGS = ("segments",)
 
-@router.get("/broadcasts")
-def list_broadcasts(
+# Newest first; rows without a timestamp sort last, as NULLS LAST did. The
+# expressions match the indexes in migrations/016_keyset_pagination.sql.
+BROADCAST_SORT_KEY = "COALESCE(b.sent_at, b.created_at, '-infinity'::timestamptz)"
+RECIPIENT_SORT_KEY = "COALESCE(last_event_at, sent_at, '-infinity'::timestamptz)"
+
+
+def _broadcast_list_params(
     limit: int = Query(default=50, ge=1, le=500),
     offset: int = Query(default=0, ge=0),
     q: str = Query(default=""),
+    cursor: Optional[str] = Query(default=None),
 ) -> dict:
-    query = q.strip().lower()
-    cache_key = f"/broadcasts?limit={limit}&offset={offset}&q={query}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    status_filter = "AND b.status IN ('sent', 'completed')"
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            if query:
-                cur.execute(
-                    f"""
-                    SELECT
-                      b.id, b.name, b.subject, b.from_address, b.status, b.segment_id,
-                      COALESCE(s.display_name, s.name) AS segment_name,
-                      b.created_at, b.sent_at, b.total_sent, b.total_delivered,
-                      b.total_opened, b.total_clicked, b.total_bounced, b.total_suppressed,
-                      b.open_rate::float8 AS open_rate, b.click_rate::float8 AS click_rate,
-                      b.synced_at
-                    FROM analytics_broadcasts b
-                    LEFT JOIN analytics_segments s ON s.id = b.segment_id
-                    WHERE (LOWER(b.name) LIKE %s OR LOWER(b.subject) LIKE %s)
-                      {status_filter}
-                    ORDER BY COALESCE(b.sent_at, b.created_at) DESC NULLS LAST
-                    LIMIT %s OFFSET %s
-                    """,
-                    (f"%{query}%", f"%{query}%", limit, offset),
-                )
-                rows = cur.fetchall()
-
-                cur.execute(
-                    f"""
-                    SELECT COUNT(*) AS count FROM analytics_broadcasts b
-                    WHERE (LOWER(b.name) LIKE %s OR LOWER(b.subject) LIKE %s)
-                      {status_filter}
-                    """,
-                    (f"%{query}%", f"%{query}%"),
-                )
-                total = cur.fetchone()["count"]
-            else:
-                cur.execute(
-                    f"""
-                    SELECT
-                      b.id, b.name, b.subject, b.from_address, b.status, b.segment_id,
-                      COALESCE(s.display_name, s.name) AS segment_name,
-                      b.created_at, b.sent_at, b.total_sent, b.total_delivered,
-                      b.total_opened, b.total_clicked, b.total_bounced, b.total_suppressed,
-                      b.open_rate::float8 AS open_rate, b.click_rate::float8 AS click_rate,
-                      b.synced_at
-                    FROM analytics_broadcasts b
-                    LEFT JOIN analytics_segments s ON s.id = b.segment_id
-                    WHERE 1=1 {status_filter}
-                    ORDER BY COALESCE(b.sent_at, b.created_at) DESC NULLS LAST
-                    LIMIT %s OFFSET %s
-                    """,
-                    (limit, offset),
-                )
-                rows = cur.fetchall()
-
-                cur.execute(
-                    f"""
-                    SELECT COUNT(*) AS count FROM analytics_broadcasts b
-                    WHERE 1=1 {status_filter}
-                    """
-                )
-                total = cur.fetchone()["count"]
-
-    result = {"data": rows, "total": total, "limit": limit, "offset": offset}
-    cache.set(cache_key, result)
-    return result
-
-
-@router.get("/broadcasts/{broadcast_id}")
-def get_broadcast(broadcast_id: UUID) -> dict:
-    cache_key = f"/broadcasts/{broadcast_id}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    after = decode_cursor(cursor, "broadcasts", 2)
+    return {
+        "limit": limit,
+        "offset": 0 if after else offset,
+        "query": q.strip().lower(),
+        "after": after,
+    }
+
+
+@cached_get(
+    router,
+    "/broadcasts",
+    params=_broadcast_list_params,
+    tags=BROADCAST_LIST_TAGS,
+    # First page in default order, as requested by the broadcasts page.
+    warm=[{"limit": 50, "offset": 0, "query": "", "after": None}],
+)
+async def list_broadcasts(limit: int, offset: int, query: str, after: list | None) -> dict:
+    where_parts = ["b.status IN ('sent', 'completed')"]
+    params: list = []
+    if query:
+        where_parts.append("(LOWER(b.name) LIKE %s OR LOWER(b.subject) LIKE %s)")
+        params.extend((like_pattern(query), like_pattern(query)))
+    count_where = " AND ".join(where_parts)
+    count_params = tuple(params)
+
+    if after:
+        where_parts.append(
+            f"({BROADCAST_SORT_KEY}, b.id) "
+            "< (COALESCE(%s::timestamptz, '-infinity'::timestamptz), %s::uuid)"
+        )
+        params.extend(after)
+
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT
+                  b.id, b.name, b.subject, b.from_address, b.status, b.segment_id,
+                  COALESCE(s.display_name, s.name) AS segment_name,
+                  b.created_at, b.sent_at, b.total_sent, b.total_delivered,
+                  b.total_opened, b.total_clicked, b.total_bounced, b.total_suppressed,
+                  b.open_rate::float8 AS open_rate, b.click_rate::float8 AS click_rate,
+                  b.synced_at
+                FROM analytics_broadcasts b
+                LEFT JOIN analytics_segments s ON s.id = b.segment_id
+                WHERE {" AND ".join(where_parts)}
+                ORDER BY {BROADCAST_SORT_KEY} DESC, b.id DESC
+                LIMIT %s OFFSET %s
+                """,
+                (*params, limit, offset),
+                prepare=True,
+            )
+            rows = await cur.fetchall()
+
+            await cur.execute(
+                f"""
+                SELECT COUNT(*) AS count FROM analytics_broadcasts b
+                WHERE {count_where}
+                """,
+                count_params,
+                prepare=True,
+            )
+            total = (await cur.fetchone())["count"]
+
+    return {
+        "data": rows,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor(
+            rows, limit, "broadcasts", lambda row: (row["sent_at"] or row["created_at"], row["id"])
+        ),
+    }
+
+
+@cached_get(
+    router,
+    "/broadcasts/{broadcast_id}",
+    tags=lambda params: (f"broadcast:{params['broadcast_id']}",),
+)
+async def get_broadcast(broadcast_id: UUID) -> dict:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   id, name, subject, from_address, status, segment_id,
@@ -110,12 +122,13 @@ def get_broadcast(broadcast_id: UUID) -> dict:
                 WHERE id = %s
                 """,
                 (broadcast_id,),
+                prepare=True,
             )
-            broadcast = cur.fetchone()
+            broadcast = await cur.fetchone()
             if not broadcast:
                 raise HTTPException(status_code=404, detail="Broadcast not found")
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   COUNT(*) AS total_recipients,
@@ -126,80 +139,92 @@ def get_broadcast(broadcast_id: UUID) -> dict:
                 WHERE broadcast_id = %s
                 """,
                 (broadcast_id,),
+                prepare=True,
             )
-            summary = cur.fetchone()
+            summary = await cur.fetchone()
 
-    result = {"broadcast": broadcast, "summary": summary}
-    cache.set(cache_key, result)
-    return result
+    return {"broadcast": broadcast, "summary": summary}
 
 
-@router.get("/broadcasts/{broadcast_id}/recipients")
-def get_broadcast_recipients(
+def _recipient_list_params(
     broadcast_id: UUID,
     limit: int = Query(default=50, ge=1, le=1000),
     offset: int = Query(default=0, ge=0),
     q: str = Query(default=""),
+    cursor: Optional[str] = Query(default=None),
+) -> dict:
+    after = decode_cursor(cursor, "recipients", 2)
+    return {
+        "broadcast_id": broadcast_id,
+        "limit": limit,
+        "offset": 0 if after else offset,
+        "query": q.strip().lower(),
+        "after": after,
+    }
+
+
+@cached_get(
+    router,
+    "/broadcasts/{broadcast_id}/recipients",
+    params=_recipient_list_params,
+    tags=lambda params: (f"broadcast:{params['broadcast_id']}",),
+)
+async def get_broadcast_recipients(
+    broadcast_id: UUID, limit: int, offset: int, query: str, after: list | None
 ) -> dict:
-    query = q.strip().lower()
-    cache_key = f"/broadcasts/{broadcast_id}/recipients?limit={limit}&offset={offset}&q={query}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            if query:
-                cur.execute(
-                    """
-                    SELECT
-                      id, broadcast_id, email_id, email_address, subject,
-                      sent_at, delivered_at, opened_at, clicked_at,
-                      bounced_at, suppressed_at, open_count, click_count, last_event_at
-                    FROM analytics_broadcast_recipients
-                    WHERE broadcast_id = %s AND LOWER(email_address) LIKE %s
-                    ORDER BY COALESCE(last_event_at, sent_at) DESC NULLS LAST
-                    LIMIT %s OFFSET %s
-                    """,
-                    (broadcast_id, f"%{query}%", limit, offset),
-                )
-                rows = cur.fetchall()
-
-                cur.execute(
-                    """
-                    SELECT COUNT(*) AS count
-                    FROM analytics_broadcast_recipients
-                    WHERE broadcast_id = %s AND LOWER(email_address) LIKE %s
-                    """,
-                    (broadcast_id, f"%{query}%"),
-                )
-                total = cur.fetchone()["count"]
-            else:
-                cur.execute(
-                    """
-                    SELECT
-                      id, broadcast_id, email_id, email_address, subject,
-                      sent_at, delivered_at, opened_at, clicked_at,
-                      bounced_at, suppressed_at, open_count, click_count, last_event_at
-                    FROM analytics_broadcast_recipients
-                    WHERE broadcast_id = %s
-                    ORDER BY COALESCE(last_event_at, sent_at) DESC NULLS LAST
-                    LIMIT %s OFFSET %s
-                    """,
-                    (broadcast_id, limit, offset),
-                )
-                rows = cur.fetchall()
-
-                cur.execute(
-                    """
-                    SELECT COUNT(*) AS count
-                    FROM analytics_broadcast_recipients
-                    WHERE broadcast_id = %s
-                    """,
-                    (broadcast_id,),
-                )
-                total = cur.fetchone()["count"]
-
-    result = {"data": rows, "total": total, "limit": limit, "offset": offset}
-    cache.set(cache_key, result)
-    return result
+    where_parts = ["broadcast_id = %s"]
+    params: list = [broadcast_id]
+    if query:
+        where_parts.append("LOWER(email_address) LIKE %s")
+        params.append(like_pattern(query))
+    count_where = " AND ".join(where_parts)
+    count_params = tuple(params)
+
+    if after:
+        where_parts.append(
+            f"({RECIPIENT_SORT_KEY}, id) "
+            "< (COALESCE(%s::timestamptz, '-infinity'::timestamptz), %s::bigint)"
+        )
+        params.extend(after)
+
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT
+                  id, broadcast_id, email_id, email_address, subject,
+                  sent_at, delivered_at, opened_at, clicked_at,
+                  bounced_at, suppressed_at, open_count, click_count, last_event_at
+                FROM analytics_broadcast_recipients
+                WHERE {" AND ".join(where_parts)}
+                ORDER BY {RECIPIENT_SORT_KEY} DESC, id DESC
+                LIMIT %s OFFSET %s
+                """,
+                (*params, limit, offset),
+                prepare=True,
+            )
+            rows = await cur.fetchall()
+
+            await cur.execute(
+                f"""
+                SELECT COUNT(*) AS count
+                FROM analytics_broadcast_recipients
+                WHERE {count_where}
+                """,
+                count_params,
+                prepare=True,
+            )
+            total = (await cur.fetchone())["count"]
+
+    return {
+        "data": rows,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor(
+            rows,
+            limit,
+            "recipients",
+            lambda row: (row["last_event_at"] or row["sent_at"], row["id"]),
+        ),
+    }
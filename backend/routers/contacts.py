@@ -2,14 +2,19 @@ from __future__ import annotations
 
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 
-from cache import cache
-from database import get_db
+from cache import cache, warm_hot_keys
+from database import get_async_db, get_db
+from services.canonical_contacts import refresh_canonical_contacts
 
 router = APIRouter()
 
+# Above this many emails a write drops every contact page through "segments"
+# (which /users/{email} is also tagged with) instead of one tag per email.
+MAX_CONTACT_TAGS = 50
+
 
 class CreateContactRequest(BaseModel):
     email: str
@@ -57,9 +62,10 @@ def create_contact(body: CreateContactRequest) -> dict:
                 (email, body.first_name, body.last_name),
             )
             row = cur.fetchone()
+            refresh_canonical_contacts(cur, [email])
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("contacts", f"contact:{email}")
     return {"ok": True, "contact": dict(row)}
 
 
@@ -80,19 +86,20 @@ def update_contact(email: str, body: CreateContactRequest) -> dict:
             )
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Contact not found")
+            refresh_canonical_contacts(cur, [normalized])
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("contacts", f"contact:{normalized}")
     return {"ok": True}
 
 
 @router.get("/contacts/{email}/segments")
-def list_contact_segments(email: str) -> dict:
+async def list_contact_segments(email: str) -> dict:
     normalized = email.strip().lower()
 
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT s.id, s.name, m.source, m.added_at
                 FROM contact_segment_memberships m
@@ -102,45 +109,45 @@ def list_contact_segments(email: str) -> dict:
                 """,
                 (normalized,),
             )
-            segments = cur.fetchall()
+            segments = await cur.fetchall()
 
     return {"email": normalized, "segments": segments}
 
 
 @router.get("/segments/{segment_id}/contacts")
-def list_segment_contacts(
+async def list_segment_contacts(
     segment_id: UUID,
     limit: int = 100,
     offset: int = 0,
 ) -> dict:
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "SELECT id FROM analytics_segments WHERE id = %s",
                 (segment_id,),
             )
-            if not cur.fetchone():
+            if not await cur.fetchone():
                 raise HTTPException(status_code=404, detail="Segment not found")
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT m.contact_email AS email, m.source, m.added_at,
                        c.first_name, c.last_name
                 FROM contact_segment_memberships m
-                LEFT JOIN analytics_contacts c ON LOWER(c.email) = m.contact_email
+                LEFT JOIN analytics_contacts_canonical c ON c.contact_id = m.contact_id
                 WHERE m.segment_id = %s
                 ORDER BY m.contact_email
                 LIMIT %s OFFSET %s
                 """,
                 (segment_id, limit, offset),
             )
-            contacts = cur.fetchall()
+            contacts = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 "SELECT COUNT(*) AS cnt FROM contact_segment_memberships WHERE segment_id = %s",
                 (segment_id,),
             )
-            total = cur.fetchone()["cnt"]
+            total = (await cur.fetchone())["cnt"]
 
     return {"segment_id": str(segment_id), "contacts": contacts, "total": total}
 
@@ -169,7 +176,7 @@ def add_contact_to_segment(email: str, segment_id: UUID) -> dict:
             )
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("memberships", f"segment:{segment_id}", f"contact:{normalized}")
     return {"ok": True}
 
 
@@ -188,7 +195,7 @@ def remove_contact_from_segment(email: str, segment_id: UUID) -> dict:
             )
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("memberships", f"segment:{segment_id}", f"contact:{normalized}")
     return {"ok": True}
 
 
@@ -219,7 +226,7 @@ def create_segment(body: CreateSegmentRequest) -> dict:
             row = cur.fetchone()
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("segments")
     return {"ok": True, "segment": dict(row)}
 
 
@@ -251,12 +258,17 @@ def bulk_add_contacts_to_segment(segment_id: UUID, body: BulkAddContactsRequest)
             added = cur.rowcount
         conn.commit()
 
-    cache.invalidate_all()
+    contact_tags = (
+        [f"contact:{email}" for email in emails]
+        if len(emails) <= MAX_CONTACT_TAGS
+        else ["segments"]
+    )
+    cache.invalidate_tags("memberships", f"segment:{segment_id}", *contact_tags)
     return {"ok": True, "added": added}
 
 
 @router.post("/segments/import")
-def import_csv_to_segment(body: ImportCsvRequest) -> dict:
+def import_csv_to_segment(body: ImportCsvRequest, background_tasks: BackgroundTasks) -> dict:
     has_id = body.segment_id and body.segment_id.strip()
     has_name = body.new_segment_name and body.new_segment_name.strip()
 
@@ -331,6 +343,7 @@ def import_csv_to_segment(body: ImportCsvRequest) -> dict:
                 """,
                 (emails, first_names, last_names),
             )
+            refresh_canonical_contacts(cur, emails)
 
             cur.execute(
                 """
@@ -345,7 +358,14 @@ def import_csv_to_segment(body: ImportCsvRequest) -> dict:
 
         conn.commit()
 
-    cache.invalidate_all()
+    # "segments" also drops every /users/{email} page, so no per-email tags.
+    cache.invalidate_tags(
+        "contacts",
+        "memberships",
+        "segments",
+        f"segment:{segment_id}",
+    )
+    background_tasks.add_task(warm_hot_keys)
     return {
         "ok": True,
         "segment_id": segment_id,
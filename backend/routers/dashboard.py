@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from cache import cache
-from database import get_db
+from cache import cached_get
+from database import get_async_db
 
 from fastapi import APIRouter
 
 router = APIRouter()
 
+DASHBOARD_TAGS = ("folders", "segments", "memberships", "contacts")
+
 EXCLUDED_PARENT_FOLDER_NAME = "to be tagged"
 OVERALL_METRIC_DEFINITIONS = (
     ("open_rate", "Open Rate"),
@@ -16,53 +18,28 @@ OVERALL_METRIC_DEFINITIONS = (
 )
 
 
-@router.get("/dashboard/parent-folders")
-def get_dashboard_parent_folders() -> dict:
-    cache_key = "/dashboard/parent-folders"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+@cached_get(
+    router,
+    "/dashboard/parent-folders",
+    tags=DASHBOARD_TAGS,
+    stale_while_revalidate=True,
+    statement_timeout=30,
+    warm=[{}],
+)
+async def get_dashboard_parent_folders() -> dict:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
-                WITH RECURSIVE folder_roots AS (
-                    SELECT
-                      id,
-                      name,
-                      parent_id,
-                      sort_order,
-                      id AS root_id,
-                      name AS root_name,
-                      sort_order AS root_sort_order
-                    FROM analytics_segment_folders
-                    WHERE parent_id IS NULL
-
-                    UNION ALL
-
-                    SELECT
-                      child.id,
-                      child.name,
-                      child.parent_id,
-                      child.sort_order,
-                      parent.root_id,
-                      parent.root_name,
-                      parent.root_sort_order
-                    FROM analytics_segment_folders child
-                    JOIN folder_roots parent ON child.parent_id = parent.id
-                ),
-                current_counts AS (
+                WITH current_counts AS (
                     SELECT
-                      fr.root_id,
-                      fr.root_name,
-                      fr.root_sort_order,
-                      COUNT(DISTINCT m.contact_email) AS total_users
+                      s.root_folder_id AS root_id,
+                      COUNT(DISTINCT m.contact_id) AS total_users
                     FROM contact_segment_memberships m
                     JOIN analytics_segments s ON s.id = m.segment_id
-                    JOIN folder_roots fr ON fr.id = s.folder_id
-                    WHERE LOWER(fr.root_name) <> %s
-                    GROUP BY fr.root_id, fr.root_name, fr.root_sort_order
+                    JOIN analytics_segment_folders root ON root.id = s.root_folder_id
+                    WHERE LOWER(root.name) <> %s
+                    GROUP BY s.root_folder_id
                 )
                 SELECT
                   roots.id,
@@ -75,10 +52,11 @@ def get_dashboard_parent_folders() -> dict:
                 ORDER BY roots.sort_order, roots.name
                 """,
                 (EXCLUDED_PARENT_FOLDER_NAME, EXCLUDED_PARENT_FOLDER_NAME),
+                prepare=True,
             )
-            parent_folders = cur.fetchall()
+            parent_folders = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   root_folder_id,
@@ -90,42 +68,12 @@ def get_dashboard_parent_folders() -> dict:
                 ORDER BY root_folder_id ASC, captured_at ASC
                 """,
                 (EXCLUDED_PARENT_FOLDER_NAME,),
+                prepare=True,
             )
-            snapshot_rows = cur.fetchall()
+            snapshot_rows = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
-                WITH ranked_contacts AS (
-                    SELECT
-                      unsubscribed,
-                      total_sent,
-                      total_delivered,
-                      total_opened,
-                      total_clicked,
-                      total_bounced,
-                      ROW_NUMBER() OVER (
-                        PARTITION BY LOWER(email)
-                        ORDER BY
-                          total_delivered DESC,
-                          total_sent DESC,
-                          total_opened DESC,
-                          total_clicked DESC,
-                          synced_at DESC NULLS LAST,
-                          id ASC
-                      ) AS email_rank
-                    FROM analytics_contacts
-                ),
-                deduped_contacts AS (
-                    SELECT
-                      unsubscribed,
-                      total_sent,
-                      total_delivered,
-                      total_opened,
-                      total_clicked,
-                      total_bounced
-                    FROM ranked_contacts
-                    WHERE email_rank = 1
-                )
                 SELECT
                   CASE
                     WHEN COALESCE(SUM(total_delivered), 0) > 0
@@ -147,12 +95,13 @@ def get_dashboard_parent_folders() -> dict:
                       THEN ROUND(COUNT(*) FILTER (WHERE unsubscribed)::numeric * 100.0 / COUNT(*), 4)::float8
                     ELSE 0
                   END AS unsubscribed_percentage
-                FROM deduped_contacts
-                """
+                FROM analytics_contacts_canonical
+                """,
+                prepare=True,
             )
-            overall_metrics = cur.fetchone()
+            overall_metrics = await cur.fetchone()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   open_rate::float8 AS open_rate,
@@ -162,9 +111,10 @@ def get_dashboard_parent_folders() -> dict:
                   captured_at
                 FROM analytics_dashboard_metric_snapshots
                 ORDER BY captured_at ASC
-                """
+                """,
+                prepare=True,
             )
-            overall_metric_snapshot_rows = cur.fetchall()
+            overall_metric_snapshot_rows = await cur.fetchall()
 
     history_by_folder_id: dict[int, list[dict]] = {}
     for row in snapshot_rows:
@@ -188,7 +138,7 @@ def get_dashboard_parent_folders() -> dict:
             ],
         })
 
-    result = {
+    return {
         "parent_folders": [
             {
                 "id": row["id"],
@@ -200,5 +150,3 @@ def get_dashboard_parent_folders() -> dict:
         ],
         "overall_metrics": overall_metric_cards,
     }
-    cache.set(cache_key, result)
-    return result
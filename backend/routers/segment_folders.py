@@ -5,73 +5,54 @@ from uuid import UUID
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from cache import cache
-from database import get_db
+from cache import cache, cached_get
+from database import get_async_db, get_db
 
 router = APIRouter()
 
+SEGMENT_FOLDER_TAGS = ("folders", "segments", "memberships")
+
 
 class MoveSegmentRequest(BaseModel):
     folder_id: int | None = None
 
 
-@router.get("/segment-folders")
-def get_segment_folders() -> dict:
-    cache_key = "/segment-folders"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+@cached_get(
+    router,
+    "/segment-folders",
+    tags=SEGMENT_FOLDER_TAGS,
+    stale_while_revalidate=True,
+    warm=[{}],
+)
+async def get_segment_folders() -> dict:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT id, name, parent_id, sort_order
                 FROM analytics_segment_folders
                 ORDER BY sort_order, name
-                """
+                """,
+                prepare=True,
             )
-            folders = cur.fetchall()
+            folders = await cur.fetchall()
 
-            cur.execute(
-                """
-                SELECT id::text, folder_id
-                FROM analytics_segments
-                WHERE folder_id IS NOT NULL
+            # Distinct contacts in each folder's segments, subfolders included.
+            await cur.execute(
                 """
+                SELECT
+                  closure.ancestor_id AS folder_id,
+                  COUNT(DISTINCT m.contact_id) AS cnt
+                FROM analytics_segment_folder_closure closure
+                JOIN analytics_segments s ON s.folder_id = closure.descendant_id
+                JOIN contact_segment_memberships m ON m.segment_id = s.id
+                GROUP BY closure.ancestor_id
+                """,
+                prepare=True,
             )
-            segment_folder_map = cur.fetchall()
-
-    folder_to_segment_ids: dict[int, list[str]] = {}
-    for row in segment_folder_map:
-        fid = row["folder_id"]
-        folder_to_segment_ids.setdefault(fid, []).append(row["id"])
-
-    def collect_segment_ids(folder_id: int) -> list[str]:
-        seg_ids = list(folder_to_segment_ids.get(folder_id, []))
-        for f in folders:
-            if f["parent_id"] == folder_id:
-                seg_ids.extend(collect_segment_ids(f["id"]))
-        return seg_ids
-
-    folder_contact_counts: dict[int, int] = {}
-    if segment_folder_map:
-        with get_db() as conn:
-            with conn.cursor() as cur:
-                for f in folders:
-                    seg_ids = collect_segment_ids(f["id"])
-                    if not seg_ids:
-                        folder_contact_counts[f["id"]] = 0
-                        continue
-                    cur.execute(
-                        """
-                        SELECT COUNT(DISTINCT contact_email) AS cnt
-                        FROM contact_segment_memberships
-                        WHERE segment_id = ANY(%s::uuid[])
-                        """,
-                        (seg_ids,),
-                    )
-                    folder_contact_counts[f["id"]] = cur.fetchone()["cnt"]
+            folder_contact_counts = {
+                row["folder_id"]: row["cnt"] for row in await cur.fetchall()
+            }
 
     def build_tree(parent_id: int | None) -> list[dict]:
         children = []
@@ -86,10 +67,7 @@ def get_segment_folders() -> dict:
                 })
         return children
 
-    tree = build_tree(None)
-    result = {"folders": tree}
-    cache.set(cache_key, result)
-    return result
+    return {"folders": build_tree(None)}
 
 
 @router.put("/segments/{segment_id}/folder")
@@ -104,6 +82,7 @@ def move_segment_to_folder(segment_id: UUID, body: MoveSegmentRequest) -> dict:
                 if not cur.fetchone():
                     raise HTTPException(status_code=404, detail="Folder not found")
 
+            # trg_segments_root_folder updates root_folder_id in the same statement.
             cur.execute(
                 "UPDATE analytics_segments SET folder_id = %s WHERE id = %s",
                 (body.folder_id, segment_id),
@@ -112,5 +91,5 @@ def move_segment_to_folder(segment_id: UUID, body: MoveSegmentRequest) -> dict:
                 raise HTTPException(status_code=404, detail="Segment not found")
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("segments", "folders", f"segment:{segment_id}")
     return {"ok": True}
@@ -5,29 +5,33 @@ from uuid import UUID
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 
-from cache import cache
-from database import get_db
+from cache import cache, cached_get
+from database import get_async_db, get_db
 
 router = APIRouter()
 
+SEGMENT_LIST_TAGS = ("segments", "memberships")
+
 
 class RenameSegmentRequest(BaseModel):
     display_name: str
 
 
-@router.get("/segments")
-def list_segments(
+@cached_get(
+    router,
+    "/segments",
+    tags=SEGMENT_LIST_TAGS,
+    stale_while_revalidate=True,
+    # First pages requested by the segments page and by the users page segment picker.
+    warm=[{"limit": 500, "offset": 0}, {"limit": 1000, "offset": 0}],
+)
+async def list_segments(
     limit: int = Query(default=100, ge=1, le=1000),
     offset: int = Query(default=0, ge=0),
 ) -> dict:
-    cache_key = f"/segments?limit={limit}&offset={offset}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   s.id,
@@ -45,7 +49,7 @@ def list_segments(
                   s.synced_at
                 FROM analytics_segments s
                 LEFT JOIN LATERAL (
-                    SELECT COUNT(DISTINCT contact_email) AS cnt
+                    SELECT COUNT(DISTINCT contact_id) AS cnt
                     FROM contact_segment_memberships
                     WHERE segment_id = s.id
                 ) c ON true
@@ -53,27 +57,25 @@ def list_segments(
                 LIMIT %s OFFSET %s
                 """,
                 (limit, offset),
+                prepare=True,
             )
-            rows = cur.fetchall()
-
-            cur.execute("SELECT COUNT(*) AS count FROM analytics_segments")
-            total = cur.fetchone()["count"]
+            rows = await cur.fetchall()
 
-    result = {"data": rows, "total": total, "limit": limit, "offset": offset}
-    cache.set(cache_key, result)
-    return result
+            await cur.execute("SELECT COUNT(*) AS count FROM analytics_segments", prepare=True)
+            total = (await cur.fetchone())["count"]
 
+    return {"data": rows, "total": total, "limit": limit, "offset": offset}
 
-@router.get("/segments/{segment_id}")
-def get_segment(segment_id: UUID) -> dict:
-    cache_key = f"/segments/{segment_id}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
 
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+@cached_get(
+    router,
+    "/segments/{segment_id}",
+    tags=lambda params: (f"segment:{params['segment_id']}", "contacts"),
+)
+async def get_segment(segment_id: UUID) -> dict:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   id,
@@ -92,12 +94,13 @@ def get_segment(segment_id: UUID) -> dict:
                 WHERE id = %s
                 """,
                 (segment_id,),
+                prepare=True,
             )
-            segment = cur.fetchone()
+            segment = await cur.fetchone()
             if not segment:
                 raise HTTPException(status_code=404, detail="Segment not found")
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   id,
@@ -116,28 +119,31 @@ def get_segment(segment_id: UUID) -> dict:
                 ORDER BY COALESCE(sent_at, created_at) DESC NULLS LAST
                 """,
                 (segment_id,),
+                prepare=True,
             )
-            broadcasts = cur.fetchall()
+            broadcasts = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
-                  LOWER(r.email_address) AS email,
+                  i.email,
                   COUNT(*) FILTER (WHERE r.delivered_at IS NOT NULL) AS delivered,
                   COUNT(*) FILTER (WHERE r.opened_at IS NOT NULL) AS opened,
                   COUNT(*) FILTER (WHERE r.clicked_at IS NOT NULL) AS clicked
                 FROM analytics_broadcast_recipients r
                 JOIN analytics_broadcasts b ON b.id = r.broadcast_id
+                JOIN analytics_contact_identities i ON i.id = r.contact_id
                 WHERE b.segment_id = %s
-                GROUP BY LOWER(r.email_address)
+                GROUP BY i.id
                 ORDER BY delivered DESC, email ASC
                 LIMIT 200
                 """,
                 (segment_id,),
+                prepare=True,
             )
-            users = cur.fetchall()
+            users = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   c.email,
@@ -150,23 +156,22 @@ def get_segment(segment_id: UUID) -> dict:
                   c.click_rate::float8 AS click_rate,
                   c.source
                 FROM contact_segment_memberships m
-                JOIN analytics_contacts c ON LOWER(c.email) = m.contact_email
+                JOIN analytics_contacts_canonical c ON c.contact_id = m.contact_id
                 WHERE m.segment_id = %s
-                ORDER BY c.email ASC
+                ORDER BY m.contact_email ASC
                 LIMIT 500
                 """,
                 (segment_id,),
+                prepare=True,
             )
-            members = cur.fetchall()
+            members = await cur.fetchall()
 
-    result = {
+    return {
         "segment": segment,
         "broadcasts": broadcasts,
         "users": users,
         "members": members,
     }
-    cache.set(cache_key, result)
-    return result
 
 
 @router.put("/segments/{segment_id}/name")
@@ -184,5 +189,5 @@ def rename_segment(segment_id: UUID, body: RenameSegmentRequest) -> dict:
                 raise HTTPException(status_code=404, detail="Segment not found")
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags("segments", f"segment:{segment_id}")
     return {"ok": True}
@@ -1,34 +1,30 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 
-from cache import cache
-from database import get_db
+from cache import cache, cached_get, warm_hot_keys
+from database import get_async_db, get_db
 from services.sync_service import SyncService
 
 router = APIRouter()
 
 
 @router.post("/sync")
-def trigger_sync() -> dict:
+def trigger_sync(background_tasks: BackgroundTasks) -> dict:
     try:
         result = SyncService().sync()
         cache.invalidate_all()
+        background_tasks.add_task(warm_hot_keys)
         return {"ok": True, "result": result}
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=f"Sync failed: {exc}") from exc
 
 
-@router.get("/sync/status")
-def get_sync_status() -> dict:
-    cache_key = "/sync/status"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+@cached_get(router, "/sync/status", tags=("sync",), ttl=10)
+async def get_sync_status() -> dict:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 SELECT
                   id,
@@ -43,15 +39,11 @@ def get_sync_status() -> dict:
                 LIMIT 1
                 """
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
     if not row:
-        result = {"status": "never_synced"}
-    else:
-        result = dict(row)
-
-    cache.set(cache_key, result)
-    return result
+        return {"status": "never_synced"}
+    return dict(row)
 
 
 @router.post("/sync/clear")
@@ -64,6 +56,7 @@ def clear_synced_data() -> dict:
                     TRUNCATE TABLE
                       analytics_broadcast_recipients,
                       analytics_contacts,
+                      analytics_contacts_canonical,
                       analytics_segments,
                       analytics_broadcasts,
                       analytics_sync_log
@@ -1,20 +1,33 @@
 from __future__ import annotations
 
-import hashlib
+import asyncio
+import csv
+import io
 import json
-from typing import Optional
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
-from cache import cache
-from database import get_db
+from cache import CachePolicy, cache, cache_key, cached_get
+from config import settings
+from database import get_async_db, query_timeout
+from membership_index import membership_index
+from pagination import decode_cursor, next_cursor
+from search import like_pattern
 
 router = APIRouter()
 
 
 ALLOWED_SORT_FIELDS = {"total_delivered", "open_rate", "click_rate"}
+# Postgres type of each sort column, for casting cursor values.
+SORT_FIELD_TYPES = {"total_delivered": "int", "open_rate": "numeric", "click_rate": "numeric"}
 ALLOWED_SORT_ORDERS = {"asc", "desc"}
+# exact: COUNT(*) over the filter. estimate: the planner's row estimate,
+# unless the exact count for the same filter is already cached.
+ALLOWED_COUNT_MODES = {"exact", "estimate"}
 BUYER_ROOT_FOLDER_NAMES = ["kickstarter"]
 BUYER_EXCLUDED_SEGMENT_NAME = "dropped backers latest"
 EXCLUDED_PARENT_FOLDER_NAME = "to be tagged"
@@ -23,6 +36,36 @@ ALLOWED_SLOT_MODES = {"any", "all"}
 ALLOWED_SLOT_CONNECTORS = {"union", "intersect", "exclude"}
 MAX_SLOTS = 20
 
+USER_LIST_TAGS = ("contacts", "memberships", "segments", "folders")
+# headline_total and parent_folders only count memberships, so contact writes
+# leave them cached.
+USER_AGGREGATE_TAGS = ("memberships", "segments", "folders")
+HEADLINE_TOTAL_POLICY = CachePolicy(route="/users#headline_total")
+PARENT_FOLDERS_POLICY = CachePolicy(route="/users#parent_folders")
+USER_TOTAL_POLICY = CachePolicy(route="/users#total")
+
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+EXPORT_COLUMNS = [
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "unsubscribed",
+    "total_sent",
+    "total_delivered",
+    "total_opened",
+    "total_clicked",
+    "total_bounced",
+    "total_suppressed",
+    "open_rate",
+    "click_rate",
+    "synced_at",
+    "original_source",
+    "buyer",
+]
+# Rows fetched per round trip from the export's server-side cursor.
+EXPORT_BATCH_SIZE = 2000
+
 
 def _parse_int_query(value: Optional[str], field_name: str) -> list[int]:
     if not value:
@@ -93,56 +136,7 @@ def _parse_slots(raw: Optional[str]) -> list[dict] | None:
     return validated
 
 
-def _build_slots_cte(slots: list[dict]) -> tuple[str, list]:
-    cte_parts: list[str] = []
-    params: list = []
-
-    for index, slot in enumerate(slots):
-        if slot["mode"] == "any":
-            cte_parts.append(
-                f"slot_{index}_emails AS ("
-                "SELECT DISTINCT contact_email "
-                "FROM contact_segment_memberships "
-                "WHERE segment_id = ANY(%s::uuid[])"
-                ")"
-            )
-            params.append(slot["segment_ids"])
-        else:
-            cte_parts.append(
-                f"slot_{index}_emails AS ("
-                "SELECT contact_email "
-                "FROM contact_segment_memberships "
-                "WHERE segment_id = ANY(%s::uuid[]) "
-                "GROUP BY contact_email "
-                "HAVING COUNT(DISTINCT segment_id) = %s"
-                ")"
-            )
-            params.append(slot["segment_ids"])
-            params.append(len(slot["segment_ids"]))
-
-    connector_map = {"union": "UNION", "intersect": "INTERSECT", "exclude": "EXCEPT"}
-
-    for index in range(len(slots)):
-        if index == 0:
-            cte_parts.append(
-                f"combined_{index} AS (SELECT contact_email FROM slot_0_emails)"
-            )
-        else:
-            sql_op = connector_map[slots[index]["connector"]]
-            cte_parts.append(
-                f"combined_{index} AS ("
-                f"SELECT contact_email FROM combined_{index - 1} "
-                f"{sql_op} "
-                f"SELECT contact_email FROM slot_{index}_emails"
-                ")"
-            )
-
-    last_combined = f"combined_{len(slots) - 1}"
-    return ", ".join(cte_parts), params, last_combined
-
-
-@router.get("/users")
-def list_users(
+def _user_list_params(
     limit: int = Query(default=100, ge=1, le=1000),
     offset: int = Query(default=0, ge=0),
     q: str = Query(default=""),
@@ -151,112 +145,84 @@ def list_users(
     slots: Optional[str] = Query(default=None),
     root_folder_ids: Optional[str] = Query(default=None),
     parent_only: bool = Query(default=False),
+    cursor: Optional[str] = Query(default=None),
+    count: str = Query(default="exact"),
 ) -> dict:
-    query = q.strip().lower()
-    sort_field = sort if sort in ALLOWED_SORT_FIELDS else "total_delivered"
-    sort_order = order if order in ALLOWED_SORT_ORDERS else "desc"
-
-    parsed_slots = _parse_slots(slots)
-    selected_root_folder_ids = _parse_int_query(root_folder_ids, "root_folder_ids")
-
-    slots_hash = hashlib.md5(slots.encode()).hexdigest() if slots else ""
-    cache_key = (
-        f"/users?limit={limit}&offset={offset}&q={query}&sort={sort_field}&order={sort_order}"
-        f"&slots={slots_hash}"
-        f"&root_folder_ids={','.join(str(fid) for fid in selected_root_folder_ids)}"
-        f"&parent_only={str(parent_only).lower()}"
-    )
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-
-    order_clause = f"{sort_field} {sort_order}, email ASC"
-
-    folder_roots_cte = """
-                WITH RECURSIVE folder_roots AS (
-                    SELECT
-                      id,
-                      name,
-                      parent_id,
-                      sort_order,
-                      id AS root_id,
-                      name AS root_name,
-                      sort_order AS root_sort_order
-                    FROM analytics_segment_folders
-                    WHERE parent_id IS NULL
-
-                    UNION ALL
-
-                    SELECT
-                      child.id,
-                      child.name,
-                      child.parent_id,
-                      child.sort_order,
-                      parent.root_id,
-                      parent.root_name,
-                      parent.root_sort_order
-                    FROM analytics_segment_folders child
-                    JOIN folder_roots parent ON child.parent_id = parent.id
-                )
-    """
-
-    slots_cte_sql = ""
-    slots_params: list = []
-    slots_combined_name = ""
+    sort = sort if sort in ALLOWED_SORT_FIELDS else "total_delivered"
+    order = order if order in ALLOWED_SORT_ORDERS else "desc"
+    count = count if count in ALLOWED_COUNT_MODES else "exact"
+    after = decode_cursor(cursor, f"users:{sort}:{order}", 2)
+    return {
+        "limit": limit,
+        "offset": 0 if after else offset,
+        "query": q.strip().lower(),
+        "sort": sort,
+        "order": order,
+        "slots": _parse_slots(slots),
+        "root_folder_ids": _parse_int_query(root_folder_ids, "root_folder_ids"),
+        "parent_only": parent_only,
+        "after": after,
+        "count": count,
+    }
 
-    if parsed_slots:
-        slots_cte_parts, slots_params, slots_combined_name = _build_slots_cte(parsed_slots)
-        slots_cte_sql = ", " + slots_cte_parts
 
+async def _user_filter(
+    query: str, slots: list[dict] | None, root_folder_ids: list[int], parent_only: bool
+) -> tuple[list[str], list]:
+    """WHERE conditions on analytics_contacts_canonical c, and their params."""
     where_parts: list[str] = []
     params: list = []
 
     if query:
-        where_parts.append("LOWER(c.email) LIKE %s")
-        params.append(f"%{query}%")
+        where_parts.append("c.email LIKE %s")
+        params.append(like_pattern(query))
 
-    if parsed_slots:
-        where_parts.append(
-            f"LOWER(c.email) IN (SELECT contact_email FROM {slots_combined_name})"
-        )
+    if slots:
+        # Set algebra over segments runs on the in-memory bitmaps; SQL only
+        # receives the resulting contact IDs.
+        where_parts.append("c.contact_id IN (SELECT unnest(%s::bigint[]))")
+        params.append(await membership_index.resolve(slots))
 
-    if selected_root_folder_ids:
+    if root_folder_ids:
         where_parts.append(
             "EXISTS ("
             "SELECT 1 "
             "FROM contact_segment_memberships m "
             "JOIN analytics_segments s ON s.id = m.segment_id "
-            "JOIN folder_roots fr_filter ON fr_filter.id = s.folder_id "
-            "WHERE m.contact_email = LOWER(c.email) "
-            "AND fr_filter.root_id = ANY(%s::int[])"
+            "WHERE m.contact_id = c.contact_id "
+            "AND s.root_folder_id = ANY(%s::int[])"
             ")"
         )
-        params.append(selected_root_folder_ids)
-    elif parent_only and not parsed_slots:
+        params.append(root_folder_ids)
+    elif parent_only and not slots:
         where_parts.append(
             "EXISTS ("
             "SELECT 1 "
             "FROM contact_segment_memberships m "
             "JOIN analytics_segments s ON s.id = m.segment_id "
-            "JOIN folder_roots fr_filter ON fr_filter.id = s.folder_id "
-            "WHERE m.contact_email = LOWER(c.email) "
-            "AND LOWER(fr_filter.root_name) <> %s"
+            "JOIN analytics_segment_folders root ON root.id = s.root_folder_id "
+            "WHERE m.contact_id = c.contact_id "
+            "AND LOWER(root.name) <> %s"
             ")"
         )
         params.append(EXCLUDED_PARENT_FOLDER_NAME)
 
-    where_clause = ("WHERE " + " AND ".join(where_parts)) if where_parts else ""
-    all_params = (*slots_params, *params)
+    return where_parts, params
+
 
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def _fetch_user_page(
+    where_clause: str, params: tuple, sort: str, order: str, limit: int, offset: int
+) -> list[dict]:
+    # Ties always break on email ASC; migrations 015 and 021 index both orders.
+    order_clause = f"{sort} {order}, email ASC"
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 f"""
-                {folder_roots_cte}
-                {slots_cte_sql},
-                ranked_contacts AS (
+                WITH filtered_contacts AS (
                     SELECT
                       c.id,
+                      c.contact_id,
                       c.email,
                       c.first_name,
                       c.last_name,
@@ -269,76 +235,29 @@ def list_users(
                       c.total_suppressed,
                       c.open_rate::float8 AS open_rate,
                       c.click_rate::float8 AS click_rate,
-                      c.synced_at,
-                      ROW_NUMBER() OVER (
-                        PARTITION BY LOWER(c.email)
-                        ORDER BY
-                          c.total_delivered DESC,
-                          c.total_sent DESC,
-                          c.total_opened DESC,
-                          c.total_clicked DESC,
-                          c.synced_at DESC NULLS LAST,
-                          c.id ASC
-                      ) AS email_rank
-                    FROM analytics_contacts c
+                      c.synced_at
+                    FROM analytics_contacts_canonical c
                     {where_clause}
-                ),
-                deduped_contacts AS (
-                    SELECT
-                      id,
-                      email,
-                      first_name,
-                      last_name,
-                      unsubscribed,
-                      total_sent,
-                      total_delivered,
-                      total_opened,
-                      total_clicked,
-                      total_bounced,
-                      total_suppressed,
-                      open_rate,
-                      click_rate,
-                      synced_at
-                    FROM ranked_contacts
-                    WHERE email_rank = 1
-                ),
-                filtered_contacts AS (
-                    SELECT
-                      id,
-                      email,
-                      first_name,
-                      last_name,
-                      unsubscribed,
-                      total_sent,
-                      total_delivered,
-                      total_opened,
-                      total_clicked,
-                      total_bounced,
-                      total_suppressed,
-                      open_rate,
-                      click_rate,
-                      synced_at
-                    FROM deduped_contacts
-                    ORDER BY {order_clause}
+                    ORDER BY c.{sort} {order}, c.email ASC
                     LIMIT %s OFFSET %s
                 ),
                 contact_membership_flags AS (
                     SELECT
-                      LOWER(fc.email) AS email,
-                      STRING_AGG(DISTINCT fr.root_name, ', ' ORDER BY fr.root_name) AS original_source,
+                      fc.contact_id,
+                      STRING_AGG(DISTINCT root.name, ', ' ORDER BY root.name) AS original_source,
                       BOOL_OR(
-                        LOWER(COALESCE(fr.root_name, '')) = ANY(%s::text[])
+                        LOWER(COALESCE(root.name, '')) = ANY(%s::text[])
                         AND LOWER(COALESCE(s.name, '')) <> %s
                         AND LOWER(COALESCE(s.display_name, '')) <> %s
                       ) AS buyer
                     FROM filtered_contacts fc
                     LEFT JOIN contact_segment_memberships m
-                      ON m.contact_email = LOWER(fc.email)
+                      ON m.contact_id = fc.contact_id
                     LEFT JOIN analytics_segments s
                       ON s.id = m.segment_id
-                    LEFT JOIN folder_roots fr
-                      ON fr.id = s.folder_id
-                    GROUP BY LOWER(fc.email)
+                    LEFT JOIN analytics_segment_folders root
+                      ON root.id = s.root_folder_id
+                    GROUP BY fc.contact_id
                 )
                 SELECT
                   fc.id,
@@ -359,57 +278,86 @@ def list_users(
                   COALESCE(cmf.buyer, FALSE) AS buyer
                 FROM filtered_contacts fc
                 LEFT JOIN contact_membership_flags cmf
-                  ON cmf.email = LOWER(fc.email)
+                  ON cmf.contact_id = fc.contact_id
                 ORDER BY {order_clause}
                 """,
                 (
-                    *all_params,
+                    *params,
                     limit,
                     offset,
                     BUYER_ROOT_FOLDER_NAMES,
                     BUYER_EXCLUDED_SEGMENT_NAME,
                     BUYER_EXCLUDED_SEGMENT_NAME,
                 ),
+                prepare=True,
             )
-            rows = cur.fetchall()
+            return await cur.fetchall()
 
-            cur.execute(
+
+async def _count_users(where_clause: str, params: tuple) -> int:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 f"""
-                {folder_roots_cte}
-                {slots_cte_sql}
-                SELECT COUNT(DISTINCT LOWER(c.email)) AS count
-                FROM analytics_contacts c
+                SELECT COUNT(*) AS count
+                FROM analytics_contacts_canonical c
                 {where_clause}
                 """,
-                tuple(all_params),
+                params,
+                prepare=True,
             )
-            total = cur.fetchone()["count"]
+            return (await cur.fetchone())["count"]
+
 
-            cur.execute(
+async def _estimate_users(where_clause: str, params: tuple) -> int:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 f"""
-                {folder_roots_cte}
-                SELECT COUNT(DISTINCT m.contact_email) AS count
+                EXPLAIN (FORMAT JSON)
+                SELECT 1
+                FROM analytics_contacts_canonical c
+                {where_clause}
+                """,
+                params,
+            )
+            plan = (await cur.fetchone())["QUERY PLAN"]
+            return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def _load_headline_total() -> int:
+    """Contacts in any parent folder; independent of the list filters."""
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT COUNT(DISTINCT m.contact_id) AS count
                 FROM contact_segment_memberships m
                 JOIN analytics_segments s ON s.id = m.segment_id
-                JOIN folder_roots fr ON fr.id = s.folder_id
-                WHERE LOWER(fr.root_name) <> %s
+                JOIN analytics_segment_folders root ON root.id = s.root_folder_id
+                WHERE LOWER(root.name) <> %s
                 """,
                 (EXCLUDED_PARENT_FOLDER_NAME,),
+                prepare=True,
             )
-            headline_total = cur.fetchone()["count"]
+            return (await cur.fetchone())["count"]
 
-            cur.execute(
-                f"""
-                {folder_roots_cte},
-                root_counts AS (
+
+async def _load_parent_folders() -> list[dict]:
+    """Parent folders with their member counts; independent of the list filters."""
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                WITH root_counts AS (
                     SELECT
-                      fr.root_id,
-                      COUNT(DISTINCT m.contact_email) AS total_users
+                      s.root_folder_id AS root_id,
+                      COUNT(DISTINCT m.contact_id) AS total_users
                     FROM contact_segment_memberships m
                     JOIN analytics_segments s ON s.id = m.segment_id
-                    JOIN folder_roots fr ON fr.id = s.folder_id
-                    WHERE LOWER(fr.root_name) <> %s
-                    GROUP BY fr.root_id
+                    JOIN analytics_segment_folders root ON root.id = s.root_folder_id
+                    WHERE LOWER(root.name) <> %s
+                    GROUP BY s.root_folder_id
                 )
                 SELECT
                   roots.id,
@@ -422,64 +370,274 @@ def list_users(
                 ORDER BY roots.sort_order, roots.name
                 """,
                 (EXCLUDED_PARENT_FOLDER_NAME, EXCLUDED_PARENT_FOLDER_NAME),
+                prepare=True,
             )
-            parent_folders = cur.fetchall()
+            return await cur.fetchall()
+
+
+@cached_get(
+    router,
+    "/users",
+    params=_user_list_params,
+    tags=USER_LIST_TAGS,
+    # Folder and slot filters over every contact; allowed longer than the default.
+    statement_timeout=30,
+    # First page of the users page in its default state (parent folders only).
+    warm=[
+        {
+            "limit": 50,
+            "offset": 0,
+            "query": "",
+            "sort": "total_delivered",
+            "order": "desc",
+            "slots": None,
+            "root_folder_ids": [],
+            "parent_only": True,
+            "after": None,
+            "count": "exact",
+        }
+    ],
+)
+async def list_users(
+    limit: int,
+    offset: int,
+    query: str,
+    sort: str,
+    order: str,
+    slots: list[dict] | None,
+    root_folder_ids: list[int],
+    parent_only: bool,
+    after: list | None,
+    count: str,
+) -> dict:
+    where_parts, params = await _user_filter(query, slots, root_folder_ids, parent_only)
+    where_clause = ("WHERE " + " AND ".join(where_parts)) if where_parts else ""
+    all_params = tuple(params)
+
+    # Keyset seek past the previous page's last (sort value, email). The
+    # email tie-break is ascending in both orders, so a row comparison only
+    # fits ascending sorts; the leading bound keeps the seek indexable.
+    page_where_clause = where_clause
+    page_params = all_params
+    if after:
+        comparison = "<" if order == "desc" else ">"
+        sort_type = SORT_FIELD_TYPES[sort]
+        page_where_clause = "WHERE " + " AND ".join((
+            *where_parts,
+            f"c.{sort} {comparison}= %s::{sort_type}",
+            f"(c.{sort} {comparison} %s::{sort_type} OR c.email > %s)",
+        ))
+        page_params = (*all_params, after[0], after[0], after[1])
+
+    # The total depends on the filter only, so paging and re-sorting reuse it.
+    total_key = cache_key(
+        USER_TOTAL_POLICY.route,
+        {
+            "query": query,
+            "slots": slots,
+            "root_folder_ids": root_folder_ids,
+            "parent_only": parent_only,
+        },
+    )
+    total_estimated = count == "estimate" and cache.get(total_key) is None
+    if total_estimated:
+        total_query = _estimate_users(where_clause, all_params)
+    else:
+        total_query = cache.get_or_compute(
+            total_key,
+            lambda: _count_users(where_clause, all_params),
+            tags=USER_LIST_TAGS,
+            policy=USER_TOTAL_POLICY,
+        )
 
-    result = {
+    # Each part runs on its own pooled connection, so a cache miss costs
+    # roughly the slowest query rather than the sum. The two aggregates do
+    # not depend on the filters and are cached once under their own keys.
+    rows, total, headline_total, parent_folders = await asyncio.gather(
+        _fetch_user_page(page_where_clause, page_params, sort, order, limit, offset),
+        total_query,
+        cache.get_or_compute(
+            HEADLINE_TOTAL_POLICY.route,
+            _load_headline_total,
+            tags=USER_AGGREGATE_TAGS,
+            policy=HEADLINE_TOTAL_POLICY,
+        ),
+        cache.get_or_compute(
+            PARENT_FOLDERS_POLICY.route,
+            _load_parent_folders,
+            tags=USER_AGGREGATE_TAGS,
+            policy=PARENT_FOLDERS_POLICY,
+        ),
+    )
+
+    return {
         "data": rows,
         "total": total,
+        "total_estimated": total_estimated,
         "headline_total": headline_total,
         "parent_folders": parent_folders,
         "limit": limit,
         "offset": offset,
+        "next_cursor": next_cursor(
+            rows, limit, f"users:{sort}:{order}", lambda row: (row[sort], row["email"])
+        ),
     }
-    cache.set(cache_key, result)
-    return result
-
 
-@router.get("/users/{email}")
-def get_user(email: str) -> dict:
-    normalized_email = email.strip().lower()
-    cache_key = f"/users/{normalized_email}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
 
-    with get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                WITH ranked_contacts AS (
+def _export_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def _export_rows(
+    fmt: str, where_clause: str, params: tuple, sort: str, order: str
+) -> AsyncIterator[str]:
+    # The timeout applies per FETCH, not to the whole stream: a named cursor
+    # runs each batch as its own statement, so a slow client never trips it.
+    with query_timeout(settings.db_statement_timeout_seconds):
+        async with get_async_db(intent="read") as conn:
+            async with conn.cursor(name="users_export") as cur:
+                # Same shape as the page query: flags are aggregated once over
+                # the selected contacts' memberships, not per exported row.
+                await cur.execute(
+                    f"""
+                    WITH selected_contacts AS (
+                        SELECT
+                          c.id,
+                          c.contact_id,
+                          c.email,
+                          c.first_name,
+                          c.last_name,
+                          c.unsubscribed,
+                          c.total_sent,
+                          c.total_delivered,
+                          c.total_opened,
+                          c.total_clicked,
+                          c.total_bounced,
+                          c.total_suppressed,
+                          c.open_rate::float8 AS open_rate,
+                          c.click_rate::float8 AS click_rate,
+                          c.synced_at
+                        FROM analytics_contacts_canonical c
+                        {where_clause}
+                    ),
+                    contact_membership_flags AS (
+                        SELECT
+                          sc.contact_id,
+                          STRING_AGG(DISTINCT root.name, ', ' ORDER BY root.name) AS original_source,
+                          BOOL_OR(
+                            LOWER(COALESCE(root.name, '')) = ANY(%s::text[])
+                            AND LOWER(COALESCE(s.name, '')) <> %s
+                            AND LOWER(COALESCE(s.display_name, '')) <> %s
+                          ) AS buyer
+                        FROM selected_contacts sc
+                        JOIN contact_segment_memberships m ON m.contact_id = sc.contact_id
+                        JOIN analytics_segments s ON s.id = m.segment_id
+                        LEFT JOIN analytics_segment_folders root ON root.id = s.root_folder_id
+                        GROUP BY sc.contact_id
+                    )
                     SELECT
-                      id,
-                      email,
-                      first_name,
-                      last_name,
-                      unsubscribed,
-                      total_sent,
-                      total_delivered,
-                      total_opened,
-                      total_clicked,
-                      total_bounced,
-                      total_suppressed,
-                      open_rate::float8 AS open_rate,
-                      click_rate::float8 AS click_rate,
-                      synced_at,
-                      ROW_NUMBER() OVER (
-                        PARTITION BY LOWER(email)
-                        ORDER BY
-                          total_delivered DESC,
-                          total_sent DESC,
-                          total_opened DESC,
-                          total_clicked DESC,
-                          synced_at DESC NULLS LAST,
-                          id ASC
-                      ) AS email_rank
-                    FROM analytics_contacts
-                    WHERE LOWER(email) = %s
+                      sc.id,
+                      sc.email,
+                      sc.first_name,
+                      sc.last_name,
+                      sc.unsubscribed,
+                      sc.total_sent,
+                      sc.total_delivered,
+                      sc.total_opened,
+                      sc.total_clicked,
+                      sc.total_bounced,
+                      sc.total_suppressed,
+                      sc.open_rate,
+                      sc.click_rate,
+                      sc.synced_at,
+                      cmf.original_source,
+                      COALESCE(cmf.buyer, FALSE) AS buyer
+                    FROM selected_contacts sc
+                    LEFT JOIN contact_membership_flags cmf ON cmf.contact_id = sc.contact_id
+                    ORDER BY sc.{sort} {order}, sc.email ASC
+                    """,
+                    (
+                        *params,
+                        BUYER_ROOT_FOLDER_NAMES,
+                        BUYER_EXCLUDED_SEGMENT_NAME,
+                        BUYER_EXCLUDED_SEGMENT_NAME,
+                    ),
                 )
+
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                if fmt == "csv":
+                    writer.writerow(EXPORT_COLUMNS)
+                while True:
+                    rows = await cur.fetchmany(EXPORT_BATCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        if fmt == "csv":
+                            writer.writerow([_export_value(row[column]) for column in EXPORT_COLUMNS])
+                        else:
+                            buffer.write(json.dumps(row, default=_export_value, separators=(",", ":")))
+                            buffer.write("\n")
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+
+
+@router.get("/users/export")
+async def export_users(
+    format: str = Query(default="csv"),
+    q: str = Query(default=""),
+    sort: str = Query(default="total_delivered"),
+    order: str = Query(default="desc"),
+    slots: Optional[str] = Query(default=None),
+    root_folder_ids: Optional[str] = Query(default=None),
+    parent_only: bool = Query(default=False),
+) -> StreamingResponse:
+    """Every contact matching the /users filters, streamed from one query.
+
+    Not cached; the result is read through a server-side cursor, so memory
+    stays flat however large the audience is.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+    sort = sort if sort in ALLOWED_SORT_FIELDS else "total_delivered"
+    order = order if order in ALLOWED_SORT_ORDERS else "desc"
+
+    where_parts, params = await _user_filter(
+        q.strip().lower(),
+        _parse_slots(slots),
+        _parse_int_query(root_folder_ids, "root_folder_ids"),
+        parent_only,
+    )
+    where_clause = ("WHERE " + " AND ".join(where_parts)) if where_parts else ""
+
+    return StreamingResponse(
+        _export_rows(format, where_clause, tuple(params), sort, order),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
+
+
+def _user_params(email: str) -> dict:
+    return {"email": email.strip().lower()}
+
+
+@cached_get(
+    router,
+    "/users/{email}",
+    params=_user_params,
+    tags=lambda params: (f"contact:{params['email']}", "segments"),
+)
+async def get_user(email: str) -> dict:
+    async with get_async_db(intent="read") as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
                 SELECT
                   id,
+                  contact_id,
                   email,
                   first_name,
                   last_name,
@@ -490,19 +648,22 @@ def get_user(email: str) -> dict:
                   total_clicked,
                   total_bounced,
                   total_suppressed,
-                  open_rate,
-                  click_rate,
+                  open_rate::float8 AS open_rate,
+                  click_rate::float8 AS click_rate,
                   synced_at
-                FROM ranked_contacts
-                WHERE email_rank = 1
+                FROM analytics_contacts_canonical
+                WHERE email = %s
                 """,
-                (normalized_email,),
+                (email,),
+                prepare=True,
             )
-            user = cur.fetchone()
+            user = await cur.fetchone()
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
+            # Internal join key for the queries below; not part of the response.
+            contact_id = user.pop("contact_id")
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   s.id,
@@ -513,14 +674,15 @@ def get_user(email: str) -> dict:
                   m.added_at
                 FROM contact_segment_memberships m
                 JOIN analytics_segments s ON s.id = m.segment_id
-                WHERE m.contact_email = %s
+                WHERE m.contact_id = %s
                 ORDER BY COALESCE(NULLIF(s.display_name, ''), s.name), s.name
                 """,
-                (normalized_email,),
+                (contact_id,),
+                prepare=True,
             )
-            segments = cur.fetchall()
+            segments = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT
                   b.id AS broadcast_id,
@@ -539,13 +701,12 @@ def get_user(email: str) -> dict:
                   r.last_event_at
                 FROM analytics_broadcast_recipients r
                 JOIN analytics_broadcasts b ON b.id = r.broadcast_id
-                WHERE LOWER(r.email_address) = %s
+                WHERE r.contact_id = %s
                 ORDER BY COALESCE(r.last_event_at, r.sent_at) DESC NULLS LAST
                 """,
-                (normalized_email,),
+                (contact_id,),
+                prepare=True,
             )
-            history = cur.fetchall()
+            history = await cur.fetchall()
 
-    result = {"user": user, "segments": segments, "history": history}
-    cache.set(cache_key, result)
-    return result
+    return {"user": user, "segments": segments, "history": history}
@@ -9,6 +9,7 @@ from pydantic import BaseModel
 from cache import cache
 from config import settings
 from database import get_db
+from services.canonical_contacts import refresh_canonical_contacts
 
 router = APIRouter()
 
@@ -55,6 +56,7 @@ def framer_email_webhook(
                 """,
                 (email, body.first_name, body.last_name),
             )
+            refresh_canonical_contacts(cur, [email])
 
             cur.execute(
                 """
@@ -68,5 +70,10 @@ def framer_email_webhook(
 
         conn.commit()
 
-    cache.invalidate_all()
+    cache.invalidate_tags(
+        "contacts",
+        "memberships",
+        f"segment:{FRAMER_SEGMENT_ID}",
+        f"contact:{email}",
+    )
     return {"ok": True, "email": email}
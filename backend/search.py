@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+# pg_trgm can only use its GIN indexes once the pattern holds a whole
+# trigram; shorter queries match as prefixes on the text_pattern_ops indexes.
+MIN_TRIGRAM_LENGTH = 3
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def like_pattern(query: str) -> str:
+    """LIKE pattern for a normalised (stripped, lowercased) search query.
+
+    Queries of MIN_TRIGRAM_LENGTH characters or more match anywhere in the
+    column; shorter ones match the start of it. Wildcards typed by the user
+    are matched literally. Compare against the same lowercased expression the
+    indexes in migrations/017_trigram_search.sql are built on.
+    """
+    escaped = _escape_like(query)
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        return f"{escaped}%"
+    return f"%{escaped}%"
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+# Winning analytics_contacts row per lowercased email, most engaged first.
+# Keep in step with the backfill in migrations/015_contacts_canonical.sql.
+_UPSERT_SQL = """
+INSERT INTO analytics_contacts_canonical (
+    email, id, first_name, last_name, unsubscribed,
+    total_sent, total_delivered, total_opened, total_clicked,
+    total_bounced, total_suppressed, total_complained,
+    open_rate, click_rate, source, synced_at
+)
+SELECT DISTINCT ON (LOWER(email))
+  LOWER(email),
+  id,
+  first_name,
+  last_name,
+  unsubscribed,
+  total_sent,
+  total_delivered,
+  total_opened,
+  total_clicked,
+  total_bounced,
+  total_suppressed,
+  total_complained,
+  open_rate,
+  click_rate,
+  source,
+  synced_at
+FROM analytics_contacts
+{where}
+ORDER BY
+  LOWER(email),
+  total_delivered DESC,
+  total_sent DESC,
+  total_opened DESC,
+  total_clicked DESC,
+  synced_at DESC NULLS LAST,
+  id ASC
+ON CONFLICT (email) DO UPDATE SET
+  id = EXCLUDED.id,
+  first_name = EXCLUDED.first_name,
+  last_name = EXCLUDED.last_name,
+  unsubscribed = EXCLUDED.unsubscribed,
+  total_sent = EXCLUDED.total_sent,
+  total_delivered = EXCLUDED.total_delivered,
+  total_opened = EXCLUDED.total_opened,
+  total_clicked = EXCLUDED.total_clicked,
+  total_bounced = EXCLUDED.total_bounced,
+  total_suppressed = EXCLUDED.total_suppressed,
+  total_complained = EXCLUDED.total_complained,
+  open_rate = EXCLUDED.open_rate,
+  click_rate = EXCLUDED.click_rate,
+  source = EXCLUDED.source,
+  synced_at = EXCLUDED.synced_at
+WHERE (analytics_contacts_canonical.*) IS DISTINCT FROM (EXCLUDED.*)
+"""
+
+
+def refresh_canonical_contacts(cur: Any, emails: Iterable[str] | None = None) -> None:
+    """Bring analytics_contacts_canonical in line with analytics_contacts.
+
+    Pass the emails a write touched to refresh just those; with no emails
+    every contact is re-ranked. Unchanged rows are not rewritten either way.
+    Runs on the caller's cursor so it commits with the write it follows.
+    """
+    if emails is None:
+        cur.execute(_UPSERT_SQL.format(where=""))
+        cur.execute(
+            """
+            DELETE FROM analytics_contacts_canonical cc
+            WHERE NOT EXISTS (
+                SELECT 1 FROM analytics_contacts c WHERE LOWER(c.email) = cc.email
+            )
+            """
+        )
+        return
+
+    keys = sorted({email.strip().lower() for email in emails if email and email.strip()})
+    if not keys:
+        return
+    cur.execute(_UPSERT_SQL.format(where="WHERE LOWER(email) = ANY(%s::text[])"), (keys,))
+    cur.execute(
+        """
+        DELETE FROM analytics_contacts_canonical cc
+        WHERE cc.email = ANY(%s::text[])
+          AND NOT EXISTS (
+              SELECT 1 FROM analytics_contacts c WHERE LOWER(c.email) = cc.email
+          )
+        """,
+        (keys,),
+    )
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import Any
 
 from database import get_db
+from services.canonical_contacts import refresh_canonical_contacts
 from services.resend_client import ResendClient
 
 
@@ -77,7 +78,7 @@ class CleanupService:
 
     def _find_bad_contacts(self) -> list[dict[str, str]]:
         """Find contacts with bounce/suppression/complaint events."""
-        with get_db() as conn:
+        with get_db(intent="read", pool="batch") as conn:
             with conn.cursor() as cur:
                 # Union webhook events and analytics recipients for full coverage
                 cur.execute("""
@@ -96,16 +97,17 @@ class CleanupService:
                     ),
                     bad_from_recipients AS (
                         SELECT DISTINCT
-                            LOWER(email_address) AS email,
+                            i.email,
                             CASE
-                                WHEN bounced_at IS NOT NULL THEN 'bounced'
-                                WHEN suppressed_at IS NOT NULL THEN 'suppressed'
-                                WHEN complained_at IS NOT NULL THEN 'complained'
+                                WHEN r.bounced_at IS NOT NULL THEN 'bounced'
+                                WHEN r.suppressed_at IS NOT NULL THEN 'suppressed'
+                                WHEN r.complained_at IS NOT NULL THEN 'complained'
                             END AS reason
-                        FROM analytics_broadcast_recipients
-                        WHERE bounced_at IS NOT NULL
-                           OR suppressed_at IS NOT NULL
-                           OR complained_at IS NOT NULL
+                        FROM analytics_broadcast_recipients r
+                        JOIN analytics_contact_identities i ON i.id = r.contact_id
+                        WHERE r.bounced_at IS NOT NULL
+                           OR r.suppressed_at IS NOT NULL
+                           OR r.complained_at IS NOT NULL
                     )
                     SELECT DISTINCT ON (email) email, reason
                     FROM (
@@ -119,14 +121,14 @@ class CleanupService:
                 return cur.fetchall()
 
     def _get_already_cleaned(self) -> set[str]:
-        with get_db() as conn:
+        with get_db(intent="read", pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT email FROM cleaned_contacts")
                 return {row["email"] for row in cur.fetchall()}
 
     def _remove_local_memberships(self, email: str) -> int:
         """Remove all segment memberships for this contact. Returns count removed."""
-        with get_db() as conn:
+        with get_db(pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     "DELETE FROM contact_segment_memberships WHERE contact_email = %s",
@@ -138,7 +140,7 @@ class CleanupService:
 
     def _mark_unsubscribed(self, email: str) -> None:
         """Mark contact as unsubscribed in analytics (preserves the row)."""
-        with get_db() as conn:
+        with get_db(pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -148,6 +150,7 @@ class CleanupService:
                     """,
                     (email,),
                 )
+                refresh_canonical_contacts(cur, [email])
             conn.commit()
 
     def _record_cleanup(
@@ -158,7 +161,7 @@ class CleanupService:
         deleted_from_resend: bool,
         error_message: str | None,
     ) -> None:
-        with get_db() as conn:
+        with get_db(pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
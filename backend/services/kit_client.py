@@ -6,6 +6,7 @@ from typing import Any
 import httpx
 
 from config import settings
+from metrics import metrics
 
 
 class KitClient:
@@ -20,6 +21,7 @@ class KitClient:
                 "X-Kit-Api-Key": settings.kit_api_key,
                 "Content-Type": "application/json",
             },
+            event_hooks={"response": [self._record_response]},
         )
         self._last_request_at = 0.0
 
@@ -29,8 +31,13 @@ class KitClient:
         min_interval = 0.2
         if elapsed < min_interval:
             time.sleep(min_interval - elapsed)
+            metrics.record_api_throttle("kit", min_interval - elapsed)
         self._last_request_at = time.monotonic()
 
+    @staticmethod
+    def _record_response(response: httpx.Response) -> None:
+        metrics.record_api_response("kit", response.status_code)
+
     def _request(
         self,
         method: str,
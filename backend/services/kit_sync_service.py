@@ -6,6 +6,7 @@ from typing import Any
 from uuid import UUID
 
 from database import get_db
+from services.canonical_contacts import refresh_canonical_contacts
 from services.kit_client import KitClient
 
 
@@ -44,7 +45,7 @@ class KitSyncService:
     def _get_existing_contacts(self) -> set[str]:
         if not self._resume:
             return set()
-        with get_db() as conn:
+        with get_db(intent="read", pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     "SELECT email FROM analytics_contacts WHERE source = 'kit'"
@@ -173,7 +174,7 @@ class KitSyncService:
             "kit",
         )
 
-        with get_db() as conn:
+        with get_db(pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -269,7 +270,7 @@ class KitSyncService:
             ))
 
         if rows:
-            with get_db() as conn:
+            with get_db(pool="batch") as conn:
                 with conn.cursor() as cur:
                     cur.executemany(
                         """
@@ -301,6 +302,7 @@ class KitSyncService:
                         """,
                         rows,
                     )
+                    refresh_canonical_contacts(cur, [row[1] for row in rows])
                 conn.commit()
 
     def _write_segments(
@@ -326,7 +328,7 @@ class KitSyncService:
             ))
 
         if rows:
-            with get_db() as conn:
+            with get_db(pool="batch") as conn:
                 with conn.cursor() as cur:
                     cur.executemany(
                         """
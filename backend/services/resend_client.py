@@ -6,6 +6,7 @@ from typing import Any
 import httpx
 
 from config import settings
+from metrics import metrics
 
 
 class ResendClient:
@@ -20,6 +21,7 @@ class ResendClient:
                 "Authorization": f"Bearer {settings.resend_api_key}",
                 "Content-Type": "application/json",
             },
+            event_hooks={"response": [self._record_response]},
         )
         self._last_request_at = 0.0
 
@@ -29,8 +31,13 @@ class ResendClient:
         min_interval = 0.55
         if elapsed < min_interval:
             time.sleep(min_interval - elapsed)
+            metrics.record_api_throttle("resend", min_interval - elapsed)
         self._last_request_at = time.monotonic()
 
+    @staticmethod
+    def _record_response(response: httpx.Response) -> None:
+        metrics.record_api_response("resend", response.status_code)
+
     def _request(
         self, method: str, path: str, params: dict[str, Any] | None = None, retries: int = 5
     ) -> dict[str, Any]:
@@ -42,6 +49,7 @@ class ResendClient:
                 if response.status_code == 429:
                     wait = 2 ** attempt
                     time.sleep(wait)
+                    metrics.record_api_throttle("resend", wait)
                     continue
                 if response.status_code >= 400:
                     raise RuntimeError(
@@ -5,6 +5,8 @@ from typing import Any
 from uuid import UUID
 
 from database import get_db
+from metrics import metrics
+from services.canonical_contacts import refresh_canonical_contacts
 from services.resend_client import ResendClient
 
 
@@ -34,7 +36,7 @@ class SyncService:
     def sync(self) -> dict[str, Any]:
         metadata = self._fetch_metadata()
 
-        with get_db() as conn:
+        with get_db(pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -57,6 +59,7 @@ class SyncService:
                             events_processed = %s,
                             last_processed_webhook_received_at = %s
                         WHERE id = %s
+                        RETURNING status, started_at, completed_at, last_processed_webhook_received_at
                         """,
                         (
                             sync_result["events_processed"],
@@ -64,6 +67,7 @@ class SyncService:
                             sync_log_id,
                         ),
                     )
+                    metrics.record_sync(cur.fetchone())
                 conn.commit()
                 return sync_result
             except Exception as exc:
@@ -76,9 +80,11 @@ class SyncService:
                             status = 'failed',
                             error_message = %s
                         WHERE id = %s
+                        RETURNING status, started_at, completed_at, last_processed_webhook_received_at
                         """,
                         (str(exc), sync_log_id),
                     )
+                    metrics.record_sync(cur.fetchone())
                 conn.commit()
                 raise
 
@@ -397,17 +403,18 @@ class SyncService:
             cur.execute(
                 """
                 SELECT
-                  LOWER(email_address) AS email,
-                  COUNT(*) FILTER (WHERE sent_at IS NOT NULL) AS total_sent,
-                  COUNT(*) FILTER (WHERE delivered_at IS NOT NULL) AS total_delivered,
-                  COUNT(*) FILTER (WHERE opened_at IS NOT NULL) AS total_opened,
-                  COUNT(*) FILTER (WHERE clicked_at IS NOT NULL) AS total_clicked,
-                  COUNT(*) FILTER (WHERE bounced_at IS NOT NULL) AS total_bounced,
-                  COUNT(*) FILTER (WHERE suppressed_at IS NOT NULL) AS total_suppressed,
-                  COUNT(*) FILTER (WHERE complained_at IS NOT NULL) AS total_complained
-                FROM analytics_broadcast_recipients
-                WHERE email_address IS NOT NULL AND email_address <> ''
-                GROUP BY LOWER(email_address)
+                  i.email,
+                  COUNT(*) FILTER (WHERE r.sent_at IS NOT NULL) AS total_sent,
+                  COUNT(*) FILTER (WHERE r.delivered_at IS NOT NULL) AS total_delivered,
+                  COUNT(*) FILTER (WHERE r.opened_at IS NOT NULL) AS total_opened,
+                  COUNT(*) FILTER (WHERE r.clicked_at IS NOT NULL) AS total_clicked,
+                  COUNT(*) FILTER (WHERE r.bounced_at IS NOT NULL) AS total_bounced,
+                  COUNT(*) FILTER (WHERE r.suppressed_at IS NOT NULL) AS total_suppressed,
+                  COUNT(*) FILTER (WHERE r.complained_at IS NOT NULL) AS total_complained
+                FROM analytics_broadcast_recipients r
+                JOIN analytics_contact_identities i ON i.id = r.contact_id
+                WHERE r.email_address <> ''
+                GROUP BY i.id
                 """
             )
             user_agg_rows = cur.fetchall()
@@ -512,6 +519,7 @@ class SyncService:
                     """,
                     contact_rows,
                 )
+                refresh_canonical_contacts(cur, [row[1] for row in contact_rows])
 
             cur.execute(
                 """
@@ -567,9 +575,10 @@ class SyncService:
                 """
                 INSERT INTO contact_segment_memberships
                     (contact_email, segment_id, source, synced_to_resend)
-                SELECT DISTINCT LOWER(r.email_address), b.segment_id, 'broadcast', TRUE
+                SELECT DISTINCT i.email, b.segment_id, 'broadcast', TRUE
                 FROM analytics_broadcast_recipients r
                 JOIN analytics_broadcasts b ON b.id = r.broadcast_id
+                JOIN analytics_contact_identities i ON i.id = r.contact_id
                 WHERE b.segment_id IS NOT NULL AND b.source = 'resend'
                 ON CONFLICT (contact_email, segment_id) DO NOTHING
                 """
@@ -580,7 +589,7 @@ class SyncService:
                 UPDATE analytics_segments s
                 SET total_contacts = COALESCE(sub.cnt, 0), synced_at = NOW()
                 FROM (
-                    SELECT segment_id, COUNT(DISTINCT contact_email) AS cnt
+                    SELECT segment_id, COUNT(DISTINCT contact_id) AS cnt
                     FROM contact_segment_memberships
                     GROUP BY segment_id
                 ) sub
@@ -608,7 +617,7 @@ class SyncService:
         """Push unsynced segment memberships to Resend."""
         from services.resend_client import ContactNotFoundError
 
-        with get_db() as conn:
+        with get_db(intent="read", pool="batch") as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     SELECT contact_email, segment_id::text
@@ -634,7 +643,7 @@ class SyncService:
                         client.create_contact(email=email, segment_ids=[segment_id])
                     pushed += 1
 
-                    with get_db() as conn:
+                    with get_db(pool="batch") as conn:
                         with conn.cursor() as cur:
                             cur.execute(
                                 """
@@ -675,7 +684,7 @@ class SyncService:
             SELECT s.id, COALESCE(c.cnt, 0), NOW()
             FROM analytics_segments s
             LEFT JOIN LATERAL (
-                SELECT COUNT(DISTINCT contact_email) AS cnt
+                SELECT COUNT(DISTINCT contact_id) AS cnt
                 FROM contact_segment_memberships
                 WHERE segment_id = s.id
             ) c ON true
@@ -683,74 +692,22 @@ class SyncService:
         )
         cur.execute(
             """
-            WITH RECURSIVE folder_roots AS (
-                SELECT
-                  id,
-                  name,
-                  parent_id,
-                  id AS root_id,
-                  name AS root_name
-                FROM analytics_segment_folders
-                WHERE parent_id IS NULL
-
-                UNION ALL
-
-                SELECT
-                  child.id,
-                  child.name,
-                  child.parent_id,
-                  parent.root_id,
-                  parent.root_name
-                FROM analytics_segment_folders child
-                JOIN folder_roots parent ON child.parent_id = parent.id
-            )
             INSERT INTO analytics_parent_folder_user_snapshots
                 (root_folder_id, root_folder_name, total_users, captured_at)
             SELECT
-              fr.root_id,
-              fr.root_name,
-              COUNT(DISTINCT m.contact_email) AS total_users,
+              root.id,
+              root.name,
+              COUNT(DISTINCT m.contact_id) AS total_users,
               NOW()
             FROM contact_segment_memberships m
             JOIN analytics_segments s ON s.id = m.segment_id
-            JOIN folder_roots fr ON fr.id = s.folder_id
-            WHERE LOWER(fr.root_name) <> 'to be tagged'
-            GROUP BY fr.root_id, fr.root_name
+            JOIN analytics_segment_folders root ON root.id = s.root_folder_id
+            WHERE LOWER(root.name) <> 'to be tagged'
+            GROUP BY root.id, root.name
             """
         )
         cur.execute(
             """
-            WITH ranked_contacts AS (
-                SELECT
-                  unsubscribed,
-                  total_sent,
-                  total_delivered,
-                  total_opened,
-                  total_clicked,
-                  total_bounced,
-                  ROW_NUMBER() OVER (
-                    PARTITION BY LOWER(email)
-                    ORDER BY
-                      total_delivered DESC,
-                      total_sent DESC,
-                      total_opened DESC,
-                      total_clicked DESC,
-                      synced_at DESC NULLS LAST,
-                      id ASC
-                  ) AS email_rank
-                FROM analytics_contacts
-            ),
-            deduped_contacts AS (
-                SELECT
-                  unsubscribed,
-                  total_sent,
-                  total_delivered,
-                  total_opened,
-                  total_clicked,
-                  total_bounced
-                FROM ranked_contacts
-                WHERE email_rank = 1
-            )
             INSERT INTO analytics_dashboard_metric_snapshots
                 (open_rate, click_rate, bounce_rate, unsubscribed_percentage, captured_at)
             SELECT
@@ -775,6 +732,6 @@ class SyncService:
                 ELSE 0
               END AS unsubscribed_percentage,
               NOW()
-            FROM deduped_contacts
+            FROM analytics_contacts_canonical
             """
         )
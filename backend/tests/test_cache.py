@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import cache as cache_module
+from cache import CachedResponse, CachePolicy, _Cache, _Entry
+from config import settings
+
+SEGMENTS_POLICY = CachePolicy(route="/segments", stale_while_revalidate=True)
+
+
+def test_stale_entries_are_discarded_after_max_stale(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    monkeypatch.setattr(settings, "cache_max_stale_seconds", 30.0)
+    store = _Cache()
+    with store._lock:
+        store._put(
+            "/segments?offset=900",
+            _Entry(CachedResponse.encode({"segments": []}), frozenset({"segments"}), SEGMENTS_POLICY),
+        )
+
+    store.invalidate_tags("segments", publish=False)
+    clock[0] += 20
+    store.set("/dashboard", {"ok": True})
+    assert "/segments?offset=900" in store._store
+
+    clock[0] += 11
+    store.set("/dashboard", {"ok": True})
+    assert "/segments?offset=900" not in store._store
+    assert "segments" not in store._tag_keys
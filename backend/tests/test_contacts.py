@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import contextlib
+from uuid import uuid4
+
+import pytest
+
+from routers import contacts
+
+
+class _Cursor:
+    rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+    def execute(self, query, params=None):
+        if "INSERT" in query:
+            self.rowcount = len(params[0])
+
+    def fetchone(self):
+        return {"id": "segment"}
+
+
+class _Connection:
+    def cursor(self):
+        return _Cursor()
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    tags: list[str] = []
+    monkeypatch.setattr(contacts, "get_db", lambda: contextlib.nullcontext(_Connection()))
+    monkeypatch.setattr(contacts.cache, "invalidate_tags", lambda *args: tags.extend(args))
+    return tags
+
+
+def test_bulk_add_tags_each_contact_when_small(invalidated):
+    segment_id = uuid4()
+    body = contacts.BulkAddContactsRequest(emails=["A@example.com", "b@example.com"])
+
+    assert contacts.bulk_add_contacts_to_segment(segment_id, body)["added"] == 2
+    assert invalidated == [
+        "memberships",
+        f"segment:{segment_id}",
+        "contact:a@example.com",
+        "contact:b@example.com",
+    ]
+
+
+def test_bulk_add_falls_back_to_segments_tag_when_large(invalidated):
+    segment_id = uuid4()
+    emails = [f"user{index}@example.com" for index in range(contacts.MAX_CONTACT_TAGS + 1)]
+
+    contacts.bulk_add_contacts_to_segment(segment_id, contacts.BulkAddContactsRequest(emails=emails))
+    assert invalidated == ["memberships", f"segment:{segment_id}", "segments"]
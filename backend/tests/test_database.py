@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import psycopg
+
+import database
+from config import settings
+
+
+class _FakeConnection:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_read_checkout_without_replica(monkeypatch):
+    monkeypatch.setattr(settings, "database_url", "postgresql://primary/db")
+    monkeypatch.setattr(settings, "database_read_url", "")
+    connections: list[_FakeConnection] = []
+
+    def connect(*args, **kwargs):
+        connections.append(_FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(psycopg, "connect", connect)
+
+    with database.get_db(intent="read") as conn:
+        assert conn is connections[0]
+    assert connections[0].closed
+
+
+def test_pool_stats_and_close_without_pools():
+    assert database.pool_stats() == {}
+    database.close_db_pool()
+    assert database.pool_stats() == {}
+
+
+def test_write_checkout_pins_only_when_block_succeeds(monkeypatch):
+    monkeypatch.setattr(settings, "database_url", "postgresql://primary/db")
+    monkeypatch.setattr(psycopg, "connect", lambda *args, **kwargs: _FakeConnection())
+    monkeypatch.setattr(database, "_primary_pinned_until", 0.0)
+
+    try:
+        with database.get_db():
+            raise LookupError("not found")
+    except LookupError:
+        pass
+    assert database._primary_pinned_until == 0.0
+
+    with database.get_db(intent="read", pool="batch"):
+        pass
+    assert database._primary_pinned_until == 0.0
+
+    with database.get_db():
+        pass
+    assert database._primary_pinned_until > 0.0
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+
+import database
+import membership_index
+from membership_index import _MembershipIndex
+
+SEGMENT_A = "00000000-0000-0000-0000-00000000000a"
+SEGMENT_B = "00000000-0000-0000-0000-00000000000b"
+
+ANY_A = [{"mode": "any", "segment_ids": [SEGMENT_A], "connector": None}]
+A_NOT_B = [
+    {"mode": "any", "segment_ids": [SEGMENT_A], "connector": None},
+    {"mode": "any", "segment_ids": [SEGMENT_B], "connector": "exclude"},
+]
+
+
+def _index(monkeypatch, memberships: dict[str, list[int]]) -> tuple[_MembershipIndex, list]:
+    monkeypatch.setattr(membership_index, "RELOAD_DEBOUNCE_SECONDS", 0)
+    index = _MembershipIndex()
+    fetches: list[list[str] | None] = []
+
+    async def fetch(segment_ids):
+        fetches.append(segment_ids)
+        return [
+            {"segment_id": segment_id, "contact_ids": contact_ids}
+            for segment_id, contact_ids in memberships.items()
+            if contact_ids and (segment_ids is None or segment_id in segment_ids)
+        ]
+
+    monkeypatch.setattr(index, "_fetch", fetch)
+    return index, fetches
+
+
+def test_resolve_evaluates_slots(monkeypatch):
+    index, fetches = _index(monkeypatch, {SEGMENT_A: [1, 2, 3, 900], SEGMENT_B: [2, 5]})
+
+    assert asyncio.run(index.resolve(A_NOT_B)) == [1, 3, 900]
+    assert asyncio.run(index.resolve(ANY_A)) == [1, 2, 3, 900]
+    assert fetches == [None]
+
+
+def test_membership_write_reloads_only_touched_segment(monkeypatch):
+    memberships = {SEGMENT_A: [1, 2], SEGMENT_B: [2]}
+    index, fetches = _index(monkeypatch, memberships)
+    asyncio.run(index.resolve(ANY_A))
+
+    memberships[SEGMENT_B] = []
+    index.invalidate(("memberships", f"segment:{SEGMENT_B}", "contact:x@example.com"))
+    index.invalidate(("segments", f"segment:{SEGMENT_A}"))
+
+    assert asyncio.run(index.resolve(A_NOT_B)) == [1, 2]
+    assert fetches == [None, [SEGMENT_B]]
+
+
+def test_untargeted_invalidation_reloads_everything(monkeypatch):
+    memberships = {SEGMENT_A: [1]}
+    index, fetches = _index(monkeypatch, memberships)
+    asyncio.run(index.resolve(ANY_A))
+
+    memberships[SEGMENT_A] = [1, 4]
+    index.invalidate(None)
+
+    assert asyncio.run(index.resolve(ANY_A)) == [1, 4]
+    assert fetches == [None, None]
+
+
+def test_full_reload_starts_in_background(monkeypatch):
+    memberships = {SEGMENT_A: [1]}
+    index, fetches = _index(monkeypatch, memberships)
+
+    async def scenario():
+        await index.resolve(ANY_A)
+        memberships[SEGMENT_A] = [1, 4]
+        index.invalidate(None)
+        await asyncio.sleep(0)  # the reload is scheduled with call_soon_threadsafe
+        await index._reload_task
+        assert fetches == [None, None]
+        assert index._up_to_date()
+        assert await index.resolve(ANY_A) == [1, 4]
+
+    asyncio.run(scenario())
+    assert fetches == [None, None]
+
+
+def test_full_reload_ignores_request_statement_timeout(monkeypatch):
+    index, _ = _index(monkeypatch, {SEGMENT_A: [1]})
+    timeouts: list[float | None] = []
+    fetch = index._fetch
+
+    async def timed_fetch(segment_ids):
+        timeouts.append(database._statement_timeout.get())
+        return await fetch(segment_ids)
+
+    monkeypatch.setattr(index, "_fetch", timed_fetch)
+    with database.query_timeout(30):
+        asyncio.run(index.resolve(ANY_A))
+    assert timeouts == [None]
+
+
+def test_bitmaps_are_sized_per_segment():
+    bitmaps = membership_index._bitmaps([
+        {"segment_id": SEGMENT_A, "contact_ids": [3]},
+        {"segment_id": SEGMENT_B, "contact_ids": [1_000_000]},
+    ])
+    assert bitmaps[SEGMENT_A].bit_length() <= 8
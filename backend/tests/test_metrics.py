@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from config import settings
+from metrics import metrics
+
+
+def test_metrics_without_replica_or_database(monkeypatch):
+    monkeypatch.setattr(settings, "database_url", "")
+    monkeypatch.setattr(settings, "database_read_url", "")
+    monkeypatch.setattr(settings, "metrics_token", "")
+    monkeypatch.setattr(metrics, "_last_sync", None)
+    client = TestClient(main.app)
+
+    response = client.get("/api/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE analytics_http_request_duration_seconds histogram" in response.text
+    assert "analytics_sync_last_duration_seconds" not in response.text
+
+
+def test_metrics_reports_recorded_sync(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "secret")
+    monkeypatch.setattr(metrics, "_last_sync", None)
+    completed_at = datetime.now(timezone.utc)
+    metrics.record_sync({
+        "status": "success",
+        "started_at": completed_at - timedelta(seconds=12),
+        "completed_at": completed_at,
+        "last_processed_webhook_received_at": None,
+    })
+    client = TestClient(main.app)
+
+    assert client.get("/api/metrics").status_code == 401
+    response = client.get("/api/metrics", headers={"Authorization": "Bearer secret"})
+
+    assert response.status_code == 200
+    assert 'analytics_sync_last_duration_seconds{status="success"} 12' in response.text
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import psycopg
+import pytest
+
+import query_stats
+from config import settings
+
+
+class _Cursor(query_stats.InstrumentedCursor):
+    # No server: execute() is stubbed below and nothing else touches the wire.
+    def __init__(self) -> None:
+        self.explained: list[str] = []
+
+    @property
+    def connection(self):
+        return None
+
+    @property
+    def rowcount(self) -> int:
+        return 1
+
+    def _explain(self, text, params):
+        self.explained.append(text)
+        return "plan"
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    statements: list[str] = []
+    monkeypatch.setattr(
+        psycopg.Cursor, "execute", lambda self, query, params=None, **kw: statements.append(query)
+    )
+    monkeypatch.setattr(settings, "db_slow_query_ms", 0.0)
+    monkeypatch.setattr(settings, "db_slow_query_explain", True)
+    query_stats.registry.reset()
+    yield statements
+    query_stats.registry.reset()
+
+
+def test_slow_advisory_lock_is_not_re_executed(executed):
+    cur = _Cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (1,))
+
+    assert executed == ["SELECT pg_advisory_lock(%s)"]
+    assert cur.explained == []
+    assert query_stats.registry.snapshot()["slow"][0]["plan"] is None
+
+
+def test_slow_table_read_is_explained(executed):
+    cur = _Cursor()
+    cur.execute("SELECT id FROM analytics_contacts WHERE email = %s", ("a@example.com",))
+
+    assert cur.explained == ["SELECT id FROM analytics_contacts WHERE email = %s"]
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "SELECT pg_notify('channel', 'payload')",
+        "SELECT set_config('statement_timeout', '1000', true)",
+        "SELECT nextval('analytics_contact_identities_id_seq') FROM analytics_contacts",
+        "SELECT 1",
+    ],
+)
+def test_side_effects_and_table_free_selects_are_not_explainable(statement):
+    assert not query_stats._explainable(statement)
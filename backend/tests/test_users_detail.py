@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+
+from routers import users
+
+USER = {"id": "c1", "contact_id": 42, "email": "a@example.com"}
+
+
+class _Cursor:
+    def __init__(self, params: list) -> None:
+        self._params = params
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def execute(self, query, params=None, prepare=None):
+        self._params.append(params)
+
+    async def fetchone(self):
+        return dict(USER)
+
+    async def fetchall(self):
+        return []
+
+
+class _Connection:
+    def __init__(self, params: list) -> None:
+        self._params = params
+
+    def cursor(self):
+        return _Cursor(self._params)
+
+
+def test_get_user_keeps_contact_id_out_of_the_response(monkeypatch):
+    params: list = []
+
+    @contextlib.asynccontextmanager
+    async def get_async_db(intent="write"):
+        yield _Connection(params)
+
+    monkeypatch.setattr(users, "get_async_db", get_async_db)
+    result = asyncio.run(users.get_user("a@example.com"))
+    assert "contact_id" not in result["user"]
+    assert params[1:] == [(42,), (42,)]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from datetime import datetime, timezone
+
+import database
+from config import settings
+from routers import users
+
+ROWS = [
+    {
+        **{column: 0 for column in users.EXPORT_COLUMNS},
+        "email": f"user{index}@example.com",
+        "synced_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "original_source": "Kickstarter",
+        "buyer": index % 2 == 0,
+    }
+    for index in range(5)
+]
+
+
+class _ServerCursor:
+    def __init__(self, statements: list) -> None:
+        self._statements = statements
+        self._rows = list(ROWS)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def execute(self, query, params=None):
+        self._statements.append((query, params, database._statement_timeout.get()))
+
+    async def fetchmany(self, size):
+        batch, self._rows = self._rows[:size], self._rows[size:]
+        return batch
+
+
+class _Connection:
+    def __init__(self, statements: list) -> None:
+        self._statements = statements
+
+    def cursor(self, name=None):
+        assert name, "exports must use a named server-side cursor"
+        return _ServerCursor(self._statements)
+
+
+def _export(monkeypatch, fmt: str) -> tuple[str, list]:
+    statements: list = []
+
+    @contextlib.asynccontextmanager
+    async def get_async_db(intent="write"):
+        yield _Connection(statements)
+
+    monkeypatch.setattr(users, "get_async_db", get_async_db)
+    monkeypatch.setattr(users, "EXPORT_BATCH_SIZE", 2)
+
+    async def collect() -> str:
+        return "".join([chunk async for chunk in users._export_rows(
+            fmt, "WHERE c.email LIKE %s", ("user%",), "total_delivered", "desc"
+        )])
+
+    return asyncio.run(collect()), statements
+
+
+def test_csv_export_runs_one_query_under_the_statement_timeout(monkeypatch):
+    body, statements = _export(monkeypatch, "csv")
+
+    lines = body.splitlines()
+    assert lines[0] == ",".join(users.EXPORT_COLUMNS)
+    assert len(lines) == 1 + len(ROWS)
+    assert "2024-01-01T00:00:00+00:00" in lines[1]
+
+    assert len(statements) == 1
+    query, params, timeout = statements[0]
+    assert "LATERAL" not in query
+    assert "ORDER BY sc.total_delivered desc, sc.email ASC" in query
+    assert params[0] == "user%"
+    assert timeout == settings.db_statement_timeout_seconds
+    assert database._statement_timeout.get() is None
+
+
+def test_ndjson_export(monkeypatch):
+    body, _ = _export(monkeypatch, "ndjson")
+
+    lines = body.splitlines()
+    assert len(lines) == len(ROWS)
+    assert lines[0].startswith('{"id":0,"email":"user0@example.com"')
+    assert lines[0].endswith('"original_source":"Kickstarter","buyer":true}')